@@ -1,5 +1,7 @@
 from .crf import CrfRule, CrfRuleGroup, CrfRuleModelConflict
+from .crf import CrfDecisionTableRule, CrfDecisionTableRuleError, DecisionRow
 from .decorators import register, RegisterRuleGroupError
+from .deferred_evaluation import deferred_rule_evaluation
 from .logic import Logic, RuleLogicError
 from .metadata_rule_evaluator import MetadataRuleEvaluator
 from .predicate import P, PF, PredicateError
@@ -11,4 +13,5 @@ from .rule_evaluator import RuleEvaluatorRegisterSubjectError, RuleEvaluatorErro
 from .rule_group_meta_options import RuleGroupMetaError
 from .rule_group_metaclass import RuleGroupError
 from .site import SiteMetadataNoRulesError, SiteMetadataRulesAlreadyRegistered
+from .site import SiteMetadataRulesNotRegistered
 from .site import site_metadata_rules
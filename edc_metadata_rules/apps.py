@@ -13,8 +13,11 @@ style = color_style()
 class AppConfig(DjangoAppConfig):
     name = 'edc_metadata_rules'
     metadata_rules_enabled = True
+    # if True, rules run once per visit on transaction commit
+    deferred_evaluation = False
 
     def ready(self):
+        from .signals import subject_rule_cache_on_post_save  # noqa
         sys.stdout.write(f'Loading {self.name} ...\n')
         site_metadata_rules.autodiscover()
         if not site_metadata_rules.registry:
@@ -22,6 +25,8 @@ class AppConfig(DjangoAppConfig):
                 ' Warning. No metadata rules have loaded.\n'))
         if not self.metadata_rules_enabled:
             sys.stdout.write(style.NOTICE(' * metadata rules disabled!\n'))
+        if self.deferred_evaluation:
+            sys.stdout.write(' * metadata rules run on transaction commit.\n')
         sys.stdout.write(f' Done loading {self.name}.\n')
 
 
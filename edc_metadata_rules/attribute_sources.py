@@ -0,0 +1,87 @@
+VISIT = 'visit'
+REGISTERED_SUBJECT = 'registered_subject'
+REFERENCE = 'reference'
+
+
+class AttributeSources:
+
+    """A class to resolve, once per model class, where the value
+    of a predicate attr comes from.
+
+    The order follows `BasePredicate.get_value`; the visit, then the
+    registered subject, otherwise a reference lookup.
+
+    Model fields are class attributes, so a lookup on a model
+    instance is answered from the model class and does not call
+    `getattr` on the instance.
+    """
+
+    def __init__(self):
+        self._has_attr = {}
+        self._rule_sources = {}
+
+    def clear(self):
+        self._has_attr = {}
+        self._rule_sources = {}
+
+    def discard_rules(self, rules=None):
+        """Drops resolved sources for the given rules, e.g. the
+        rules of a rule group that is replaced or unregistered.
+        """
+        rules = set(rules or [])
+        self._rule_sources = {
+            key: sources for key, sources in self._rule_sources.items()
+            if key[0] not in rules}
+
+    def has_attr(self, model_cls=None, attr=None):
+        """Returns True if attr is an attribute of the model class.
+        """
+        key = (model_cls, attr)
+        try:
+            return self._has_attr[key]
+        except KeyError:
+            has_attr = hasattr(model_cls, attr)
+            self._has_attr[key] = has_attr
+            return has_attr
+
+    def instance_has_attr(self, instance=None, attr=None):
+        """Returns True if attr is an attribute of the instance.
+        """
+        model_cls = instance.__class__
+        if self.has_attr(model_cls, attr):
+            return True
+        elif hasattr(model_cls, '_meta'):
+            return False
+        return hasattr(instance, attr)
+
+    def get_source(self, attr=None, visit_model_cls=None,
+                   registered_subject_model_cls=None):
+        if self.has_attr(visit_model_cls, attr):
+            return VISIT
+        elif self.has_attr(registered_subject_model_cls, attr):
+            return REGISTERED_SUBJECT
+        return REFERENCE
+
+    def get_rule_sources(self, rule=None, visit_model_cls=None,
+                         registered_subject_model_cls=None):
+        """Returns a frozenset of sources read by the rule's predicate
+        or None if the rule has no field names, e.g. the predicate
+        is a plain function.
+        """
+        key = (rule, visit_model_cls, registered_subject_model_cls)
+        try:
+            return self._rule_sources[key]
+        except KeyError:
+            sources = None
+            if rule.field_names:
+                sources = frozenset([
+                    self.get_source(
+                        attr=attr,
+                        visit_model_cls=visit_model_cls,
+                        registered_subject_model_cls=registered_subject_model_cls)
+                    for attr in rule.field_names])
+            self._rule_sources[key] = sources
+            return sources
+
+
+attribute_sources = AttributeSources()
@@ -1,2 +1,4 @@
+from .crf_decision_table_rule import CrfDecisionTableRule, CrfDecisionTableRuleError
+from .crf_decision_table_rule import DecisionRow
 from .crf_rule import CrfRule, CrfRuleModelConflict
 from .crf_rule_group import CrfRuleGroup
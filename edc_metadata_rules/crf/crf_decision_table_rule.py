@@ -0,0 +1,162 @@
+import csv
+
+from collections import OrderedDict, namedtuple
+from edc_metadata import NOT_REQUIRED, REQUIRED, DO_NOTHING
+
+from ..predicate import PF, NoValueError
+from ..rule_evaluator import RuleEvaluator
+from .crf_rule import CrfRule, CrfRuleModelConflict
+
+DecisionRow = namedtuple(
+    'DecisionRow', 'value target_models consequence alternative')
+
+NO_VALUE = object()
+
+
+class CrfDecisionTableRuleError(Exception):
+    pass
+
+
+class DecisionTableRuleEvaluator(RuleEvaluator):
+
+    """A rule evaluator that sets self.result to the value of the
+    rule's attr or NO_VALUE.
+    """
+
+    def evaluate(self, **options):
+        try:
+            return self.logic.predicate(**options)
+        except NoValueError:
+            return NO_VALUE
+
+
+class CrfDecisionTableRule(CrfRule):
+
+    """A rule that maps the values of one attr to the entry status
+    of its target models.
+
+    Each row is evaluated as if it were a rule,
+    `CrfRule(predicate=P(attr, 'eq', value), ...)`, and the rows as
+    if they were declared in order in one rule group. The outcome of
+    each distinct value is computed once, when the rule group is
+    declared, so evaluation is one value fetch and one dictionary
+    lookup.
+
+    For example:
+
+        class MyRuleGroup(CrfRuleGroup):
+
+            transport = CrfDecisionTableRule(
+                attr='f1',
+                rows=[('car', ['crftwo']), ('bicycle', ['crfthree'])])
+
+    A row is a DecisionRow or a tuple of (value, target_models,
+    consequence, alternative) where consequence and alternative
+    default to REQUIRED and NOT_REQUIRED.
+    """
+
+    rule_evaluator_cls = DecisionTableRuleEvaluator
+
+    def __init__(self, attr=None, rows=None, **kwargs):
+        self._rows = []
+        for row in rows or []:
+            row = list(row)
+            if len(row) == 2:
+                row.extend([REQUIRED, NOT_REQUIRED])
+            try:
+                row = DecisionRow(*row)
+            except TypeError:
+                raise CrfDecisionTableRuleError(
+                    f'Invalid row. Expected (value, target_models, consequence, '
+                    f'alternative). Got {row}.')
+            for result in [row.consequence, row.alternative]:
+                if result not in self.logic_cls.valid_results:
+                    raise CrfDecisionTableRuleError(
+                        f'Invalid result on row. Expected one of '
+                        f'{self.logic_cls.valid_results}. Got {result}.')
+            self._rows.append(row)
+        if not self._rows:
+            raise CrfDecisionTableRuleError(
+                f'Decision table has no rows. Got attr={attr}.')
+        target_models = []
+        for row in self._rows:
+            target_models.extend(
+                [t for t in row.target_models if t not in target_models])
+        self._table = None
+        self._default = None
+        super().__init__(
+            predicate=PF(attr, func=lambda value: value),
+            consequence=DO_NOTHING,
+            alternative=DO_NOTHING,
+            target_models=target_models,
+            **kwargs)
+
+    @classmethod
+    def from_csv(cls, attr=None, path=None, value_type=None, **kwargs):
+        """Returns a rule with rows read from a CSV file with columns
+        value, target_models, consequence and alternative.
+
+        Target models are separated by a space. Values are strings
+        unless `value_type`, e.g. int, is given.
+        """
+        rows = []
+        with open(path, newline='') as f:
+            for record in csv.DictReader(f):
+                value = record.get('value')
+                rows.append(DecisionRow(
+                    value if value_type is None else value_type(value),
+                    record.get('target_models').split(),
+                    record.get('consequence') or REQUIRED,
+                    record.get('alternative') or NOT_REQUIRED))
+        return cls(attr=attr, rows=rows, **kwargs)
+
+    def freeze(self):
+        self._table, self._default = self.compile()
+        super().freeze()
+
+    def compile(self):
+        """Returns a tuple of ({value: outcome}, default_outcome)
+        where outcome is an ordered dictionary of
+        {target_model: entry_status}.
+
+        As with a rule group, a DO_NOTHING row does not change the
+        outcome of an earlier row for the same target model.
+        """
+        rows = [
+            DecisionRow(row.value, [self.get_label_lower(t) for t in row.target_models],
+                        row.consequence, row.alternative)
+            for row in self._rows]
+        table = {}
+        for value in [row.value for row in rows]:
+            if value not in table:
+                table.update({value: self.get_outcome(rows=rows, value=value)})
+        return table, self.get_outcome(rows=rows, value=NO_VALUE)
+
+    def get_outcome(self, rows=None, value=None):
+        outcome = OrderedDict([(t, None) for t in self.target_models])
+        for row in rows:
+            entry_status = row.consequence if row.value == value else row.alternative
+            if entry_status != DO_NOTHING:
+                for target_model in row.target_models:
+                    outcome.update({target_model: entry_status})
+        return outcome
+
+    def get_label_lower(self, target_model=None):
+        if len(target_model.split('.')) != 2:
+            target_model = f'{self.app_label}.{target_model}'
+        return target_model
+
+    def run(self, visit=None):
+        if self.source_model in self.target_models:
+            raise CrfRuleModelConflict(
+                f'Source model cannot be a target model. Got \'{self.source_model}\' '
+                f'is in target models {self.target_models}')
+        opts = {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
+        value = self.rule_evaluator_cls(
+            visit=visit, logic=self._logic, rule=self, **opts).result
+        if value is NO_VALUE:
+            return OrderedDict([(t, None) for t in self.target_models])
+        try:
+            return OrderedDict(self._table.get(value, self._default))
+        except TypeError:  # unhashable value
+            return OrderedDict(self._default)
@@ -2,7 +2,7 @@ from collections import OrderedDict
 from edc_metadata import MetadataUpdater
 from edc_metadata.target_handler import TargetModelConflict
 
-from ..rule_group import RuleGroup
+from ..rule_group import RuleGroup, MetadataUpdate
 from ..rule_group_metaclass import RuleGroupMetaclass
 
 
@@ -30,21 +30,34 @@ class CrfRuleGroup(RuleGroup, metaclass=RuleGroupMetaclass):
         return crfs
 
     @classmethod
-    def evaluate_rules(cls, visit=None):
+    def get_metadata_updates(cls, visit=None):
         rule_results = OrderedDict()
-        metadata_objects = OrderedDict()
+        metadata_updates = []
+        crf_models = [c.model for c in cls.crfs_for_visit(visit)]
         for rule in cls._meta.options.get('rules'):
-            rule_results.update({str(rule): rule.run(visit=visit)})
-            for target_model, entry_status in rule_results[str(rule)].items():
-                if target_model == visit._meta.label_lower:
-                    raise TargetModelConflict(
-                        f'Target model and visit model are the same! '
-                        f'Got {target_model}=={visit._meta.label_lower}')
-                # only do something if target model is in visit.crfs
-                if target_model in [c.model for c in cls.crfs_for_visit(visit)]:
-                    metadata_updater = cls.metadata_updater_cls(
-                        visit=visit, target_model=target_model)
-                    metadata_obj = metadata_updater.update(
-                        entry_status=entry_status)
-                    metadata_objects.update({target_model: metadata_obj})
-        return rule_results, metadata_objects
+            rule_results[str(rule)], updates = cls.get_rule_metadata_updates(
+                rule=rule, visit=visit, crf_models=crf_models)
+            metadata_updates.extend(updates)
+        return rule_results, metadata_updates
+
+    @classmethod
+    def get_rule_metadata_updates(cls, rule=None, visit=None, crf_models=None):
+        """Returns a tuple of (rule_result, metadata_updates) after
+        running one rule.
+
+        Only target models scheduled for the visit are updated.
+        """
+        if crf_models is None:
+            crf_models = [c.model for c in cls.crfs_for_visit(visit)]
+        metadata_updates = []
+        rule_result = rule.run(visit=visit)
+        for target_model, entry_status in rule_result.items():
+            if target_model == visit._meta.label_lower:
+                raise TargetModelConflict(
+                    f'Target model and visit model are the same! '
+                    f'Got {target_model}=={visit._meta.label_lower}')
+            # only do something if target model is in visit.crfs
+            if target_model in crf_models:
+                metadata_updates.append(
+                    MetadataUpdate(target_model, None, entry_status))
+        return rule_result, metadata_updates
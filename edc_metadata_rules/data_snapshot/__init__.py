@@ -0,0 +1,6 @@
+from .mmap_snapshot import MmapSnapshot, MmapSnapshotError, MmapSnapshotWriter
+from .readers import DataSnapshotOrderError, DataSnapshotReaderError
+from .readers import read_csv, read_jsonl, read_snapshot, read_sqlite
+from .records import SnapshotRecord, SnapshotReferenceGetter, SnapshotReferences
+from .records import SnapshotVisit
+from .snapshot_rule_evaluator import SnapshotRuleEvaluator, SnapshotRuleEvaluatorError
@@ -0,0 +1,390 @@
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from .records import datatypes
+
+MAGIC = b'EDCMRSNP'
+VERSION = 1
+HEADER = struct.Struct('<8sIBxxxQQQ')
+
+# value types
+NONE = 0
+STR = 1
+INT = 2
+FLOAT = 3
+DECIMAL = 4
+DATE = 5
+DATETIME = 6
+NAIVE_DATETIME = 7
+BOOL = 8
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NAIVE_EPOCH = datetime(1970, 1, 1)
+
+# (name, array typecode) in file order
+COLUMNS = [
+    ('subject_identifier', 'I'),
+    ('name', 'I'),
+    ('visit_code', 'I'),
+    ('field_name', 'I'),
+    ('report_datetime_type', 'B'),
+    ('report_datetime', 'q'),
+    ('value_type', 'B'),
+    ('value', 'q'),
+]
+
+
+class MmapSnapshotError(Exception):
+    pass
+
+
+def _align(offset=None):
+    return offset + (-offset % 8)
+
+
+def _float_to_int(value=None):
+    return struct.unpack('<q', struct.pack('<d', value))[0]
+
+
+def _int_to_float(value=None):
+    return struct.unpack('<d', struct.pack('<q', value))[0]
+
+
+def _microseconds(value=None):
+    delta = value - (NAIVE_EPOCH if value.tzinfo is None else EPOCH)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class MmapSnapshotWriter:
+
+    """A class to write reference values and registered subjects to
+    a file read by `MmapSnapshot`.
+
+    The file is columnar with fixed-width columns. Strings, e.g.
+    subject identifiers, model names and string values, are stored
+    once in a sorted string table and referred to by index. Rows are
+    sorted, so the ids of a subject's rows are found by binary search.
+
+    Registered subjects are stored as one row per field.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._strings = set([''])
+
+    def write(self, references=None, registered_subjects=None):
+        """Writes the file and returns its path.
+
+        `references` and `registered_subjects` are iterables of
+        dictionaries as read by `read_snapshot`, in any order.
+        """
+        reference_rows = self.get_reference_rows(references)
+        registered_subject_rows = self.get_registered_subject_rows(registered_subjects)
+        for rows in [reference_rows, registered_subject_rows]:
+            for row in rows:
+                if isinstance(row[5], (str, Decimal)):
+                    self.intern(str(row[5]))
+        strings = sorted(self._strings)
+        ids = {string: index for index, string in enumerate(strings)}
+        tables = [self.get_columns(rows, ids)
+                  for rows in [reference_rows, registered_subject_rows]]
+        tmp_path = f'{self.path}.tmp{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(
+                MAGIC, VERSION, 0 if sys.byteorder == 'little' else 1,
+                len(strings), len(reference_rows), len(registered_subject_rows)))
+            self.write_strings(f, strings)
+            for columns in tables:
+                for column in columns:
+                    self.write_aligned(f, column.tobytes())
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    def get_reference_rows(self, references=None):
+        """Returns a list of row tuples with values converted to
+        their datatype.
+        """
+        rows = []
+        for row in references or []:
+            value = row.get('value')
+            if value is not None and row.get('datatype'):
+                value = datatypes[row.get('datatype')](value)
+            report_datetime = row.get('report_datetime')
+            if report_datetime is not None:
+                report_datetime = datatypes['datetime'](report_datetime)
+            rows.append((
+                self.intern(row['subject_identifier']), self.intern(row['model']),
+                self.intern(row['visit_code']), self.intern(row['field_name']),
+                report_datetime, value))
+        return rows
+
+    def get_registered_subject_rows(self, registered_subjects=None):
+        """Returns a list of row tuples, one per field.
+        """
+        rows = []
+        for record in registered_subjects or []:
+            for field_name, value in record.items():
+                rows.append((
+                    self.intern(record['subject_identifier']), '', '',
+                    self.intern(field_name), None, value))
+        return rows
+
+    def write_strings(self, f=None, strings=None):
+        """Writes the string offsets followed by the UTF-8 encoded
+        strings.
+        """
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = array('Q', [0])
+        for string in encoded:
+            offsets.append(offsets[-1] + len(string))
+        self.write_aligned(f, offsets.tobytes())
+        self.write_aligned(f, b''.join(encoded))
+
+    def intern(self, value=None):
+        if value is None:
+            value = ''
+        self._strings.add(value)
+        return value
+
+    def get_columns(self, rows=None, ids=None):
+        """Returns a list of arrays, one per column, of the encoded
+        rows sorted by subject, name, visit code and field name.
+        """
+        encoded = sorted([
+            (ids[subject_identifier], ids[name], ids[visit_code], ids[field_name])
+            + self.encode(report_datetime, ids) + self.encode(value, ids)
+            for subject_identifier, name, visit_code, field_name, report_datetime, value
+            in rows])
+        columns = []
+        for index, (column_name, typecode) in enumerate(COLUMNS):
+            column = array(typecode, [row[index] for row in encoded])
+            columns.append(column)
+        return columns
+
+    @staticmethod
+    def encode(value=None, ids=None):
+        """Returns a tuple of (value type, int).
+        """
+        if value is None:
+            return NONE, 0
+        elif isinstance(value, bool):
+            return BOOL, int(value)
+        elif isinstance(value, int):
+            return INT, value
+        elif isinstance(value, float):
+            return FLOAT, _float_to_int(value)
+        elif isinstance(value, Decimal):
+            return DECIMAL, ids[str(value)]
+        elif isinstance(value, datetime):
+            return (NAIVE_DATETIME if value.tzinfo is None else DATETIME,
+                    _microseconds(value))
+        elif isinstance(value, date):
+            return DATE, value.toordinal()
+        elif isinstance(value, str):
+            return STR, ids[value]
+        raise MmapSnapshotError(
+            f'Value type not supported. Got {type(value)}.')
+
+    @staticmethod
+    def write_aligned(f=None, data=None):
+        f.write(data)
+        f.write(b'\0' * (-len(data) % 8))
+
+
+class StringTable:
+
+    """A sequence of the interned strings, decoded on access.
+    """
+
+    def __init__(self, offsets=None, blob=None):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+    def get_id(self, string=None):
+        """Returns the index of the string or None.
+        """
+        index = bisect_left(self, string)
+        if index < len(self) and self[index] == string:
+            return index
+        return None
+
+
+class MmapSnapshotTable:
+
+    """A table of a memory-mapped snapshot.
+
+    Columns are memoryviews of the file, so reading rows does not
+    copy the table into the process.
+    """
+
+    def __init__(self, snapshot=None, columns=None):
+        self.snapshot = snapshot
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['subject_identifier'])
+
+    def get_range(self, subject_identifier=None):
+        """Returns a range of the subject's row indexes.
+        """
+        subject_id = self.snapshot.strings.get_id(subject_identifier)
+        if subject_id is None:
+            return range(0)
+        column = self.columns['subject_identifier']
+        return range(bisect_left(column, subject_id), bisect_right(column, subject_id))
+
+    def get_rows(self, subject_identifier=None):
+        """Yields a dictionary of {column name: decoded value} for each
+        of the subject's rows.
+        """
+        strings = self.snapshot.strings
+        columns = self.columns
+        for index in self.get_range(subject_identifier):
+            yield dict(
+                subject_identifier=subject_identifier,
+                name=strings[columns['name'][index]],
+                visit_code=strings[columns['visit_code'][index]],
+                field_name=strings[columns['field_name'][index]],
+                report_datetime=self.snapshot.decode(
+                    columns['report_datetime_type'][index],
+                    columns['report_datetime'][index]),
+                value=self.snapshot.decode(
+                    columns['value_type'][index], columns['value'][index]))
+
+
+class MmapReferences(MmapSnapshotTable):
+
+    def get(self, subject_identifier=None):
+        """Returns a list of the subject's reference rows, see
+        `SnapshotReferences`.
+        """
+        return [dict(subject_identifier=subject_identifier, model=row['name'],
+                     visit_code=row['visit_code'], field_name=row['field_name'],
+                     report_datetime=row['report_datetime'], value=row['value'])
+                for row in self.get_rows(subject_identifier)]
+
+
+class MmapRegisteredSubjects(MmapSnapshotTable):
+
+    def get(self, subject_identifier=None):
+        """Returns a list of one registered subject record or an
+        empty list.
+        """
+        record = {row['field_name']: row['value']
+                  for row in self.get_rows(subject_identifier)}
+        return [record] if record else []
+
+
+class MmapSnapshot:
+
+    """A class to read a file written by `MmapSnapshotWriter`.
+
+    The file is memory-mapped read-only, so worker processes that
+    open the same file share one copy of it in the page cache. An
+    instance is pickled by path and reopened, e.g. when passed to a
+    worker process.
+
+    For example:
+
+        snapshot = MmapSnapshot('references.snapshot')
+        evaluator = SnapshotRuleEvaluator(
+            visit_model='ambition_subject.subjectvisit',
+            visits=read_snapshot('visits_part_3.csv'),
+            registered_subjects=snapshot.registered_subjects,
+            references=snapshot.references)
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._views = [view]
+        magic, version, byteorder, string_count, reference_count, \
+            registered_subject_count = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise MmapSnapshotError(
+                f'Not a metadata rules snapshot or wrong version. Got {path}.')
+        if byteorder != (0 if sys.byteorder == 'little' else 1):
+            raise MmapSnapshotError(
+                f'Snapshot was written on a platform with another byte order. '
+                f'Got {path}.')
+        offset = HEADER.size
+        offsets, offset = self._get_column(view, offset, 'Q', string_count + 1)
+        self._views.append(offsets)
+        blob = view[offset:offset + offsets[-1]]
+        self._views.append(blob)
+        offset = _align(offset + offsets[-1])
+        self.strings = StringTable(offsets=offsets, blob=blob)
+        tables = []
+        for count in [reference_count, registered_subject_count]:
+            columns = {}
+            for name, typecode in COLUMNS:
+                columns[name], offset = self._get_column(view, offset, typecode, count)
+                self._views.append(columns[name])
+            tables.append(columns)
+        self.references = MmapReferences(snapshot=self, columns=tables[0])
+        self.registered_subjects = MmapRegisteredSubjects(snapshot=self, columns=tables[1])
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(\'{self.path}\')'
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.strings = None
+        self.references = None
+        self.registered_subjects = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    @staticmethod
+    def _get_column(view=None, offset=None, typecode=None, count=None):
+        """Returns a tuple of (memoryview of the column, next offset).
+        """
+        itemsize = array(typecode).itemsize
+        column = view[offset:offset + itemsize * count].cast(typecode)
+        return column, _align(offset + itemsize * count)
+
+    def decode(self, value_type=None, value=None):
+        if value_type == NONE:
+            return None
+        elif value_type == STR:
+            return self.strings[value]
+        elif value_type == INT:
+            return value
+        elif value_type == FLOAT:
+            return _int_to_float(value)
+        elif value_type == DECIMAL:
+            return Decimal(self.strings[value])
+        elif value_type == DATE:
+            return date.fromordinal(value)
+        elif value_type == DATETIME:
+            return EPOCH + timedelta(microseconds=value)
+        elif value_type == NAIVE_DATETIME:
+            return NAIVE_EPOCH + timedelta(microseconds=value)
+        elif value_type == BOOL:
+            return bool(value)
+        raise MmapSnapshotError(f'Unknown value type. Got {value_type}.')
@@ -0,0 +1,133 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+
+
+class DataSnapshotReaderError(Exception):
+    pass
+
+
+class DataSnapshotOrderError(Exception):
+    pass
+
+
+def get_record(values=None, converters=None):
+    """Returns a dictionary of values with empty strings as None and
+    converters, e.g. {'age': int}, applied.
+    """
+    record = {}
+    for key, value in values.items():
+        if value == '':
+            value = None
+        if value is not None and converters and key in converters:
+            value = converters[key](value)
+        record[key] = value
+    return record
+
+
+def read_csv(path=None, converters=None):
+    """Yields a dictionary for each row of a CSV file with a header.
+    """
+    with open(path, newline='') as f:
+        for values in csv.DictReader(f):
+            yield get_record(values, converters)
+
+
+def read_jsonl(path=None, converters=None):
+    """Yields a dictionary for each line of a JSON lines file.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield get_record(json.loads(line), converters)
+
+
+def read_sqlite(path=None, table=None, order_by=None, chunk_size=None, converters=None):
+    """Yields a dictionary for each row of an SQLite table, fetched
+    `chunk_size` rows at a time and ordered by `order_by`, default
+    subject_identifier.
+    """
+    order_by = order_by or 'subject_identifier'
+    for name in [table, order_by]:
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name or ''):
+            raise DataSnapshotReaderError(
+                f'Invalid table or column name. Got {name}.')
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        cursor = connection.execute(f'SELECT * FROM {table} ORDER BY {order_by}')
+        while True:
+            rows = cursor.fetchmany(chunk_size or 1000)
+            if not rows:
+                break
+            for row in rows:
+                yield get_record(dict(row), converters)
+    finally:
+        connection.close()
+
+
+def read_snapshot(path=None, table=None, **kwargs):
+    """Returns a reader for a CSV (.csv), JSON lines (.jsonl) or
+    SQLite (.db, .sqlite, .sqlite3) file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return read_csv(path, **kwargs)
+    elif extension in ['.jsonl', '.json']:
+        return read_jsonl(path, **kwargs)
+    elif extension in ['.db', '.sqlite', '.sqlite3']:
+        return read_sqlite(path, table=table, **kwargs)
+    raise DataSnapshotReaderError(
+        f'Unknown snapshot format. Expected .csv, .jsonl or .sqlite. Got {path}.')
+
+
+def iter_subjects(records=None):
+    """Yields (subject_identifier, [record, ...]) for records sorted
+    by subject_identifier or raises DataSnapshotOrderError.
+    """
+    subject_identifier = None
+    group = []
+    for record in records:
+        if subject_identifier is not None:
+            if record['subject_identifier'] < subject_identifier:
+                raise DataSnapshotOrderError(
+                    f'Expected records sorted by subject_identifier. '
+                    f'Got {record["subject_identifier"]} after {subject_identifier}.')
+            if record['subject_identifier'] != subject_identifier:
+                yield subject_identifier, group
+                group = []
+        subject_identifier = record['subject_identifier']
+        group.append(record)
+    if group:
+        yield subject_identifier, group
+
+
+class SubjectCursor:
+
+    """A class to read records sorted by subject_identifier in step
+    with another stream sorted the same way.
+
+    Only the records of the current subject are held in memory.
+    """
+
+    def __init__(self, records=None):
+        self._subjects = iter_subjects(records or [])
+        self._current = None
+        self._exhausted = False
+
+    def get(self, subject_identifier=None):
+        """Returns the list of records for the subject, if any.
+
+        Subjects must be requested in order.
+        """
+        while not self._exhausted and (
+                self._current is None or self._current[0] < subject_identifier):
+            try:
+                self._current = next(self._subjects)
+            except StopIteration:
+                self._exhausted = True
+        if self._current and self._current[0] == subject_identifier:
+            return self._current[1]
+        return []
@@ -0,0 +1,136 @@
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from django.utils.dateparse import parse_date, parse_datetime
+from edc_reference.reference import ReferenceObjectDoesNotExist
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+SnapshotMeta = namedtuple('SnapshotMeta', 'label_lower app_label')
+
+datatypes = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'decimal': Decimal,
+    'date': lambda value: value if isinstance(value, date) else parse_date(value),
+    'datetime': lambda value: (
+        value if isinstance(value, datetime) else parse_datetime(value)),
+}
+
+
+class SnapshotRecord:
+
+    """A class for a row of a data snapshot, e.g. a registered
+    subject, with each value as an attribute.
+
+    Values are instance attributes and not class attributes as on a
+    model, so rules reading them are never served from the subject
+    rule cache.
+    """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'subject_identifier=\'{getattr(self, "subject_identifier", None)}\')')
+
+
+class SnapshotVisit(SnapshotRecord):
+
+    """A class for a visit row of a data snapshot that stands in
+    for a visit model instance.
+
+    Expects subject_identifier, visit_schedule_name, schedule_name,
+    visit_code and report_datetime and, optionally, id and
+    visit_code_sequence (default 0).
+    """
+
+    def __init__(self, visit_model=None, **values):
+        super().__init__(**values)
+        self._meta = SnapshotMeta(visit_model, visit_model.split('.')[0])
+        self.report_datetime = datatypes['datetime'](self.report_datetime)
+        self.visit_code_sequence = int(values.get('visit_code_sequence') or 0)
+        self.pk = values.get('id') or (
+            self.subject_identifier, self.visit_code, self.visit_code_sequence)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'subject_identifier=\'{self.subject_identifier}\', '
+                f'visit_code=\'{self.visit_code}\', '
+                f'visit_code_sequence={self.visit_code_sequence})')
+
+    @property
+    def visit(self):
+        """Returns the visit schedule's visit, as on a visit model.
+        """
+        visit_schedule = site_visit_schedules.get_visit_schedule(
+            visit_schedule_name=self.visit_schedule_name)
+        schedule = visit_schedule.schedules.get(self.schedule_name)
+        return schedule.visits.get(self.visit_code)
+
+
+class SnapshotReferences:
+
+    """A class to look up the reference values of one subject.
+
+    Expects rows with model, visit_code, field_name and value and,
+    optionally, report_datetime and datatype, e.g. 'int' or 'date'.
+    If a row has a report_datetime, it must match the visit's.
+    """
+
+    def __init__(self, rows=None):
+        self._values = {}
+        for row in rows or []:
+            value = row.get('value')
+            if value is not None and row.get('datatype'):
+                value = datatypes[row.get('datatype')](value)
+            report_datetime = row.get('report_datetime')
+            if report_datetime is not None:
+                report_datetime = datatypes['datetime'](report_datetime)
+            self._values.setdefault(
+                (row['model'], row['visit_code'], row['field_name']), []).append(
+                    (report_datetime, value))
+
+    def get_value(self, name=None, visit_code=None, field_name=None,
+                  report_datetime=None):
+        """Returns the value or raises KeyError.
+        """
+        for row_report_datetime, value in self._values[(name, visit_code, field_name)]:
+            if row_report_datetime is None or row_report_datetime == report_datetime:
+                return value
+        raise KeyError((name, visit_code, field_name, report_datetime))
+
+
+class SnapshotReferenceGetter:
+
+    """A reference getter that reads a value from a data snapshot
+    instead of the reference model.
+
+    See `edc_reference.ReferenceGetter`.
+    """
+
+    def __init__(self, references=None, name=None, field_name=None,
+                 subject_identifier=None, report_datetime=None,
+                 visit_code=None, **kwargs):
+        self.name = name
+        self.field_name = field_name
+        self.subject_identifier = subject_identifier
+        self.report_datetime = report_datetime
+        self.visit_code = visit_code
+        self.has_value = False
+        try:
+            value = references.get_value(
+                name=name, visit_code=visit_code, field_name=field_name,
+                report_datetime=report_datetime)
+        except KeyError:
+            raise ReferenceObjectDoesNotExist(
+                f'Reference not found in data snapshot. Got {repr(self)}.')
+        self.has_value = True
+        setattr(self, field_name, value)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(name=\'{self.name}\', '
+                f'field_name=\'{self.field_name}\', '
+                f'subject_identifier=\'{self.subject_identifier}\', '
+                f'visit_code=\'{self.visit_code}\')')
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from functools import partial
+
+from ..evaluation_context import evaluation_context, get_evaluation_context
+from ..metadata_rule_evaluator import MetadataRuleEvaluator
+from ..rule_evaluator import RuleEvaluatorRegisterSubjectError
+from ..site import site_metadata_rules
+from .mmap_snapshot import MmapSnapshotTable
+from .readers import SubjectCursor, iter_subjects
+from .records import SnapshotRecord, SnapshotReferenceGetter, SnapshotReferences
+from .records import SnapshotVisit
+
+
+class SnapshotRuleEvaluatorError(Exception):
+    pass
+
+
+class SnapshotRuleEvaluator:
+
+    """A class to evaluate rules for the visits in a data snapshot
+    without querying the database.
+
+    A configured Django project is still required; the app registry
+    must be ready, the visit schedules registered with
+    `site_visit_schedules` and the rule groups with
+    `site_metadata_rules`, as in a management command or shell.
+
+    `visits`, `registered_subjects` and `references` are iterables of
+    dictionaries, e.g. from `read_snapshot`, each sorted by
+    subject_identifier. They are read in one pass, one subject at a
+    time, so memory is bounded by the largest subject.
+    `registered_subjects` and `references` may instead be tables of
+    an `MmapSnapshot`, read by subject.
+
+    Results are those of each rule group's `get_metadata_updates`, so
+    are the same as `evaluate_rules` on the same data. Rules with a
+    function that queries the database, e.g. a PredicateCollection
+    refset, are not supported.
+
+    For example:
+
+        evaluator = SnapshotRuleEvaluator(
+            visit_model='ambition_subject.subjectvisit',
+            visits=read_snapshot('visits.csv'),
+            registered_subjects=read_snapshot('registered_subjects.csv'),
+            references=read_snapshot('references.jsonl'))
+        for visit, results in evaluator.evaluate():
+            entry_statuses = evaluator.get_entry_statuses(results)
+    """
+
+    visit_cls = SnapshotVisit
+    registered_subject_cls = SnapshotRecord
+    references_cls = SnapshotReferences
+    reference_getter_cls = SnapshotReferenceGetter
+    metadata_rule_evaluator_cls = MetadataRuleEvaluator
+
+    def __init__(self, visit_model=None, visits=None, registered_subjects=None,
+                 references=None, snapshot=None):
+        self.visit_model = visit_model
+        self.app_label = visit_model.split('.')[0]
+        self.visits = visits
+        self.registered_subjects = registered_subjects
+        self.references = references
+        self.snapshot = snapshot or site_metadata_rules.snapshot
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(visit_model=\'{self.visit_model}\')'
+
+    def evaluate(self):
+        """Yields (visit, results) for each visit, by subject and then
+        report_datetime, where results is an ordered dictionary of
+        {rule_group: (rule_results, metadata_updates)}.
+        """
+        registered_subjects = self.get_subject_cursor(self.registered_subjects)
+        references = self.get_subject_cursor(self.references)
+        for subject_identifier, visits in iter_subjects(self.visits):
+            yield from self.evaluate_subject(
+                subject_identifier=subject_identifier,
+                visits=visits,
+                registered_subjects=registered_subjects.get(subject_identifier),
+                references=references.get(subject_identifier))
+
+    @staticmethod
+    def get_subject_cursor(records=None):
+        """Returns an object with a `get(subject_identifier)` method
+        that returns the subject's records.
+        """
+        if isinstance(records, MmapSnapshotTable):
+            return records
+        return SubjectCursor(records)
+
+    def evaluate_subject(self, subject_identifier=None, visits=None,
+                         registered_subjects=None, references=None):
+        """Returns a list of (visit, results) for one subject, see
+        `evaluate`, in an evaluation context of its own.
+        """
+        if get_evaluation_context() is not None:
+            raise SnapshotRuleEvaluatorError(
+                f'Cannot evaluate a data snapshot in an evaluation context '
+                f'that reads from the database. See {repr(self)}.')
+        if not registered_subjects:
+            raise RuleEvaluatorRegisterSubjectError(
+                f'Registered subject required. Not found in data snapshot. '
+                f'subject_identifier=\'{subject_identifier}\'. See {repr(self)}.')
+        visits = sorted(
+            [self.visit_cls(visit_model=self.visit_model, **visit) for visit in visits],
+            key=lambda visit: visit.report_datetime)
+        reference_getter = partial(
+            self.reference_getter_cls, references=self.references_cls(references))
+        results = []
+        with evaluation_context(
+                snapshot=self.snapshot, reference_getter=reference_getter) as context:
+            context.registered_subjects.update(
+                {subject_identifier: self.registered_subject_cls(
+                    **registered_subjects[0])})
+            for visit in visits:
+                metadata_rule_evaluator = self.metadata_rule_evaluator_cls(
+                    visit=visit, app_label=self.app_label)
+                results.append((visit, OrderedDict([
+                    (rule_group, rule_group.get_metadata_updates(visit=visit))
+                    for rule_group in metadata_rule_evaluator.get_rule_groups(
+                        snapshot=context.snapshot)])))
+        return results
+
+    @staticmethod
+    def get_entry_statuses(results=None):
+        """Returns an ordered dictionary of {(target_model, panel
+        name): entry_status} for the results of one visit.
+
+        Metadata updates are applied in order, as by `evaluate_rules`,
+        and updates without an entry status are ignored.
+        """
+        entry_statuses = OrderedDict()
+        for _, metadata_updates in results.values():
+            for target_model, target_panel, entry_status in metadata_updates:
+                if entry_status:
+                    entry_statuses.update({
+                        (target_model, getattr(target_panel, 'name', None)):
+                        entry_status})
+        return entry_statuses
@@ -0,0 +1,112 @@
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.apps import apps as django_apps
+from django.db import transaction
+from functools import partial
+
+from .evaluation_context import ContextVar
+
+_deferred = ContextVar('edc_metadata_rules_deferred', default=None)
+
+
+class DeferredEvaluations(threading.local):
+
+    """A class to collect visits marked for rule evaluation and
+    evaluate each once when the transaction commits.
+
+    All marks for the same visit within a transaction are coalesced
+    into one evaluation using the last visit instance marked. If the
+    marks were for different changes, all rule groups are evaluated.
+
+    Only the public `on_commit` API is used. Django discards the
+    callbacks of a rolled back transaction or savepoint, so a visit
+    marked only in a rolled back savepoint is not evaluated; a visit
+    also marked outside of it is evaluated once, as above. Marks
+    left without a callback are discarded when the transaction ends,
+    see `discard_rolled_back`.
+    """
+
+    def __init__(self):
+        self._pending = OrderedDict()
+        self._evaluating = False
+
+    @property
+    def pending(self):
+        """Returns an ordered dictionary of {key: metadata_rule_evaluator}
+        for the visits waiting for the transaction to commit.
+        """
+        self.discard_rolled_back()
+        return self._pending
+
+    def add(self, metadata_rule_evaluator=None):
+        visit = metadata_rule_evaluator.visit
+        key = (metadata_rule_evaluator.app_label,
+               visit._meta.label_lower, visit.pk)
+        previous = self.pending.pop(key, None)
+        if previous and (
+                (previous.source_model, previous.changed_fields, previous.source_panel)
+                != (metadata_rule_evaluator.source_model,
+                    metadata_rule_evaluator.changed_fields,
+                    metadata_rule_evaluator.source_panel)):
+            metadata_rule_evaluator.changed_fields = None
+            metadata_rule_evaluator.source_panel = None
+        self._pending.update({key: metadata_rule_evaluator})
+        transaction.on_commit(partial(self.evaluate, key))
+
+    def evaluate(self, key=None):
+        """Evaluates rules for the visit, if not already evaluated
+        by an earlier callback in this commit.
+        """
+        metadata_rule_evaluator = self._pending.pop(key, None)
+        if metadata_rule_evaluator:
+            self._evaluating = True
+            try:
+                with transaction.atomic():
+                    metadata_rule_evaluator.evaluate_rules(deferred=False)
+            finally:
+                self._evaluating = False
+
+    def discard_rolled_back(self):
+        """Removes all visits once the transaction has ended.
+
+        Outside of a transaction nothing is waiting to commit; a
+        visit still pending was marked in a transaction or savepoint
+        that was rolled back, since a committed mark is removed by its
+        callback. Not checked while callbacks are being run on commit.
+        """
+        if not self._evaluating and transaction.get_autocommit():
+            self._pending.clear()
+
+
+deferred_evaluations = DeferredEvaluations()
+
+
+def is_deferred():
+    """Returns True if rule evaluation should be deferred to
+    transaction commit.
+    """
+    deferred = _deferred.get()
+    if deferred is None:
+        app_config = django_apps.get_app_config('edc_metadata_rules')
+        deferred = getattr(app_config, 'deferred_evaluation', False)
+    return deferred
+
+
+@contextmanager
+def deferred_rule_evaluation(deferred=True):
+    """A context manager to defer rule evaluation to transaction
+    commit regardless of the AppConfig setting.
+
+    For example:
+
+        with transaction.atomic(), deferred_rule_evaluation():
+            for form in forms:
+                form.save()
+    """
+    token = _deferred.set(deferred)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
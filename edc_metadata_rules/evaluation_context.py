@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from edc_reference.reference import ReferenceObjectDoesNotExist
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # python < 3.7
+    from threading import local
+
+    class ContextVar(local):
+
+        """A thread local stand-in for `contextvars.ContextVar`.
+        """
+
+        def __init__(self, name, default=None):
+            self.name = name
+            self.value = default
+
+        def get(self):
+            return self.value
+
+        def set(self, value):
+            token = self.value
+            self.value = value
+            return token
+
+        def reset(self, token):
+            self.value = token
+
+
+_evaluation_context = ContextVar('edc_metadata_rules_evaluation_context', default=None)
+
+
+class EvaluationContext:
+
+    """A class to hold state for one evaluation pass.
+
+    Rules and rule groups are shared by all threads and must not be
+    changed during evaluation. Anything that is per pass, such as the
+    registry snapshot and loaded instances, is kept here instead.
+
+    References for a source model in `absent_source_models` are
+    treated as not existing, e.g. while the source model instance is
+    being deleted.
+
+    If `reference_getter` is given, it is called instead of each
+    rule's reference getter class, e.g. to read reference values from
+    a data snapshot instead of the database.
+    """
+
+    def __init__(self, snapshot=None, reference_getter=None):
+        self.snapshot = snapshot
+        self.reference_getter = reference_getter
+        self.registered_subjects = {}
+        self.references = {}
+        self.refsets = {}
+        self.predicate_results = {}
+        self.values = {}
+        self.absent_source_models = set()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(snapshot={self.snapshot})'
+
+    def get_reference(self, reference_getter_cls=None, **options):
+        """Returns a reference getter instance, or raises
+        ReferenceObjectDoesNotExist, fetched once per pass for
+        the given options.
+        """
+        if options.get('name') in self.absent_source_models:
+            raise ReferenceObjectDoesNotExist(
+                f'Source model is absent. Got {options.get("name")}.')
+        key = (reference_getter_cls, ) + tuple(sorted(options.items()))
+        try:
+            reference = self.references[key]
+        except KeyError:
+            try:
+                reference = (self.reference_getter or reference_getter_cls)(**options)
+            except ReferenceObjectDoesNotExist as e:
+                reference = e
+            self.references[key] = reference
+        if isinstance(reference, ReferenceObjectDoesNotExist):
+            raise reference
+        return reference
+
+    def get_refset(self, refset_cls=None, key_options=None, **options):
+        """Returns a refset instance, e.g. a LongitudinalRefset,
+        created once per pass for the given options.
+
+        If `key_options` is given, only those options identify the
+        refset, so a refset is shared by calls that differ in other
+        options, e.g. the report_datetime of each visit.
+        """
+        if key_options is not None:
+            key_items = [(k, options.get(k)) for k in sorted(key_options)]
+        else:
+            key_items = sorted(options.items())
+        try:
+            key = (refset_cls, ) + tuple(key_items)
+            hash(key)
+        except TypeError:
+            return refset_cls(**options)
+        try:
+            refset = self.refsets[key]
+        except KeyError:
+            refset = refset_cls(**options)
+            self.refsets[key] = refset
+        return refset
+
+
+def get_evaluation_context():
+    """Returns the current evaluation context or None.
+    """
+    return _evaluation_context.get()
+
+
+@contextmanager
+def evaluation_context(context=None, **kwargs):
+    """A context manager that sets the evaluation context for the
+    current thread or task.
+
+    If a context is already set, it is reused. If `context` is
+    given, e.g. one filled in another thread, it is set instead of a
+    new one.
+    """
+    current = _evaluation_context.get()
+    if current is not None:
+        yield current
+    else:
+        context = context or EvaluationContext(**kwargs)
+        token = _evaluation_context.set(context)
+        try:
+            yield context
+        finally:
+            _evaluation_context.reset(token)
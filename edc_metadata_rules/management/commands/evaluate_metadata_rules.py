@@ -0,0 +1,39 @@
+from django.apps import apps as django_apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...subject_metadata_rule_evaluator import SubjectMetadataRuleEvaluator
+from ...throttle import Throttle, add_throttle_arguments
+
+
+class Command(BaseCommand):
+
+    help = ('Evaluates metadata rules for all visits of the given subject(s), '
+            'or of all registered subjects, in chunks of subjects')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'subject_identifiers', nargs='*',
+            help='subject identifier(s). Default: all registered subjects')
+        parser.add_argument(
+            '--app-label', dest='app_label', default=None,
+            help='only visits of the visit model for this app_label')
+        add_throttle_arguments(parser)
+
+    def handle(self, *args, **options):
+        subject_identifiers = options.get('subject_identifiers')
+        if not subject_identifiers:
+            model_cls = django_apps.get_app_config('edc_registration').model
+            subject_identifiers = model_cls.objects.values_list(
+                'subject_identifier', flat=True).order_by('subject_identifier')
+        throttle = Throttle.from_options(options)
+        visits = 0
+        for chunk in throttle.chunks(subject_identifiers, options.get('chunk_size')):
+            for subject_identifier in chunk:
+                with transaction.atomic():
+                    results = SubjectMetadataRuleEvaluator(
+                        subject_identifier=subject_identifier,
+                        app_label=options.get('app_label')).evaluate_rules()
+                visits += len(results)
+        self.stdout.write(
+            f'Evaluated metadata rules for {visits} visit(s). {throttle}.')
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+
+    help = ('Saves CRFs and requisitions of the test models for the same visits '
+            'from concurrent workers and reports rule evaluation and metadata '
+            'lock wait and write times. Use with the test settings and a local '
+            'database only')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', dest='workers', type=int, nargs='+', default=[1, 4],
+            help='number of concurrent workers, one run per value. Default: 1 4')
+        parser.add_argument(
+            '--processes', dest='processes', action='store_true', default=False,
+            help='run workers as processes instead of threads')
+        parser.add_argument(
+            '--subjects', dest='subjects', type=int, default=2,
+            help='subjects (visits) shared by the workers. Default: 2')
+        parser.add_argument(
+            '--saves', dest='saves', type=int, default=50,
+            help='saves per worker. Default: 50')
+        parser.add_argument(
+            '--rate', dest='rate', type=float, default=None,
+            help='maximum saves per second per worker. Default: no limit')
+        parser.add_argument(
+            '--unordered', dest='unordered', action='store_true', default=False,
+            help='apply metadata updates in rule declaration order, for comparison')
+
+    def handle(self, *args, **options):
+        from ...tests.load_test import LoadTest
+
+        load_test = LoadTest(
+            subjects=options.get('subjects'),
+            saves=options.get('saves'),
+            rate=options.get('rate'),
+            unordered=options.get('unordered'))
+        load_test.setup()
+        try:
+            self.run_load_test(load_test, **options)
+        finally:
+            load_test.teardown()
+
+    def run_load_test(self, load_test=None, **options):
+        mode = 'processes' if options.get('processes') else 'threads'
+        for workers in options.get('workers'):
+            summary = load_test.run(workers=workers, processes=options.get('processes'))
+            self.stdout.write(
+                f'{workers} {mode}{" (unordered)" if options.get("unordered") else ""}: '
+                f'{summary["saves"]} saves, {summary["deadlocks"]} deadlock(s), '
+                f'{summary["lock_timeouts"]} lock timeout(s), '
+                f'{summary["errors"]} other error(s)')
+            for name in ['evaluation', 'lock_wait', 'write', 'total']:
+                self.stdout.write('  {:<10} p50={} p95={} p99={}'.format(
+                    name, *[self.format_ms(summary[f'{name}_p{p}']) for p in [50, 95, 99]]))
+
+    @staticmethod
+    def format_ms(value=None):
+        return '-' if value is None else f'{value:.1f}ms'
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...subject_metadata_rule_evaluator import SubjectMetadataRuleEvaluator
+from ...throttle import Throttle, add_throttle_arguments
+
+
+class Command(BaseCommand):
+
+    help = ('Re-evaluates rules that read registered subject fields for '
+            'all visits of the given subject(s)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'subject_identifiers', nargs='+', help='subject identifier(s)')
+        add_throttle_arguments(parser)
+
+    def handle(self, *args, **options):
+        throttle = Throttle.from_options(options)
+        for chunk in throttle.chunks(
+                options.get('subject_identifiers'), options.get('chunk_size')):
+            for subject_identifier in chunk:
+                with transaction.atomic():
+                    results = SubjectMetadataRuleEvaluator(
+                        subject_identifier=subject_identifier
+                    ).refresh_registered_subject_rules()
+                updated = sum(
+                    [len(metadata_objects) for metadata_objects in results.values()])
+                self.stdout.write(
+                    f'{subject_identifier}: {len(results)} visit(s), '
+                    f'{updated} metadata object(s) updated.')
+        self.stdout.write(f'{throttle}.')
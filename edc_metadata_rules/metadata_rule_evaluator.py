@@ -1,4 +1,18 @@
+import asyncio
+
+from collections import OrderedDict
+
+from django.apps import apps as django_apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, transaction
+from edc_metadata import NOT_REQUIRED, REQUIRED
 from edc_metadata_rules.site import site_metadata_rules
+from edc_reference.reference import ReferenceObjectDoesNotExist
+
+from .attribute_sources import attribute_sources, REFERENCE
+from .deferred_evaluation import deferred_evaluations, is_deferred
+from .evaluation_context import EvaluationContext, evaluation_context
+from .rule_group import MetadataUpdate
 
 
 class MetadataRuleEvaluator:
@@ -6,12 +20,336 @@ class MetadataRuleEvaluator:
     """Main class to evaluate rules.
 
     Used by model mixin.
+
+    Rule groups are read from the site's registry snapshot as it was
+    when evaluation started, so evaluation is not affected by rule
+    groups registered in the meantime.
+
+    If deferred, `evaluate_rules` only marks the visit and rules are
+    evaluated once per visit when the transaction commits. See
+    `deferred_rule_evaluation`.
+
+    If `source_model` and `changed_fields` are given, rule groups
+    with that source model are skipped if none of their rules read a
+    changed field. Rule groups with a rule that does not declare its
+    fields, e.g. a plain function, are never skipped. See
+    `MetadataRulesChangedFieldsModelMixin`.
     """
 
-    def __init__(self, visit=None, app_label=None):
+    # if False, `aprefetch` reads values concurrently, each in its own
+    # thread and database connection, instead of on the shared sync thread.
+    async_thread_sensitive = True
+
+    def __init__(self, visit=None, app_label=None, deferred=None,
+                 source_model=None, changed_fields=None, source_panel=None):
         self.visit = visit
         self.app_label = app_label or visit._meta.app_label
+        self.deferred = deferred
+        self.source_model = source_model
+        self.changed_fields = None if changed_fields is None else set(changed_fields)
+        self.source_panel = getattr(source_panel, 'name', source_panel)
+
+    def get_rule_group_options(self, rule_group=None):
+        """Returns options for the rule group's `evaluate_rules` and
+        `get_metadata_updates`.
+
+        Requisition rule groups with the saved model as source model
+        only run the rules for the source panel, if given.
+        """
+        if (self.source_panel and self.source_model == rule_group._meta.source_model
+                and hasattr(rule_group._meta, 'rules_by_source_panel')):
+            return dict(source_panel=self.source_panel)
+        return {}
+
+    def get_rule_groups(self, snapshot=None):
+        """Returns a list of rule groups to evaluate, in registry order.
+
+        Rule groups scoped to another visit schedule, schedule or
+        visit code are not included.
+        """
+        rule_groups = snapshot.rule_groups_for_visit(
+            app_label=self.app_label, visit=self.visit)
+        return [rule_group for rule_group in rule_groups
+                if not self.is_unchanged(rule_group)]
+
+    def is_unchanged(self, rule_group=None):
+        """Returns True if the rule group's source model was saved
+        without changing any field read by its rules.
+        """
+        if (self.changed_fields is None or not self.source_model
+                or rule_group._meta.source_model != self.source_model):
+            return False
+        for rule in rule_group.get_rules():
+            if not rule.field_names or self.changed_fields.intersection(rule.field_names):
+                return False
+        return True
+
+    def evaluate_rules(self, deferred=None):
+        """Evaluates the rule groups and applies the metadata updates
+        of all rule groups in one transaction, see
+        `apply_rule_metadata_updates`.
+
+        Returns an ordered dictionary of metadata objects, see
+        `get_metadata_key`, or None if deferred.
+        """
+        deferred = self.deferred if deferred is None else deferred
+        if deferred is None:
+            deferred = is_deferred()
+        if deferred:
+            deferred_evaluations.add(metadata_rule_evaluator=self)
+            return
+        return self.apply_rule_metadata_updates(self.get_metadata_updates())
+
+    def get_metadata_updates(self):
+        """Returns a list of (rule_group, MetadataUpdate) for all rule
+        groups without changing metadata.
+        """
+        metadata_updates = []
+        with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+            for rule_group in self.get_rule_groups(snapshot=context.snapshot):
+                _, updates = rule_group.get_metadata_updates(
+                    visit=self.visit, **self.get_rule_group_options(rule_group))
+                metadata_updates.extend(
+                    [(rule_group, metadata_update) for metadata_update in updates])
+        return metadata_updates
+
+    def evaluate_rules_for_target(self, target_model=None, target_panel=None):
+        """Evaluates only the rules that update metadata for the
+        target model or requisition panel and returns the metadata
+        object or None.
+
+        `target_panel` may be a panel or a panel name.
+        """
+        metadata_updates = []
+        panel_name = getattr(target_panel, 'name', target_panel)
+        with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+            rule_groups = self.get_rule_groups(snapshot=context.snapshot)
+            for rule_reference in context.snapshot.rules_for_target(
+                    target_model=target_model, target_panel=panel_name):
+                if rule_reference.rule_group in rule_groups:
+                    metadata_updates.extend(self.get_rule_metadata_updates(
+                        rule_reference=rule_reference,
+                        target_model=target_model,
+                        panel_name=panel_name))
+        metadata_objects = self.apply_rule_metadata_updates(metadata_updates)
+        return metadata_objects.get(self.get_metadata_key(
+            MetadataUpdate(target_model, panel_name, None)))
+
+    def evaluate_rules_for_deleted(self, source_model=None):
+        """Evaluates only the rules of rule groups with the given
+        source model, as if the source model instance does not exist,
+        and returns an ordered dictionary of the metadata objects
+        updated.
+
+        Rules that read the source model and have no value without
+        the source model instance reset their targets to the default
+        entry status of the visit schedule, see `reads_source_model`
+        and `get_default_metadata_update`. Targets of other rules,
+        e.g. a DO_NOTHING outcome of a rule that only reads the
+        registered subject, are left as is.
+
+        For use when the source model instance is deleted.
+        """
+        metadata_updates = []
+        with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+            absent = source_model not in context.absent_source_models
+            context.absent_source_models.add(source_model)
+            try:
+                rule_groups = self.get_rule_groups(snapshot=context.snapshot)
+                for rule_reference in context.snapshot.rules_for_source(source_model):
+                    if rule_reference.rule_group in rule_groups:
+                        updates = self.get_rule_metadata_updates(
+                            rule_reference=rule_reference)
+                        if self.reads_source_model(rule_reference.rule):
+                            updates = [
+                                (rule_group, self.get_default_metadata_update(
+                                    rule_group, metadata_update))
+                                for rule_group, metadata_update in updates]
+                        metadata_updates.extend(updates)
+            finally:
+                if absent:
+                    context.absent_source_models.discard(source_model)
+        return self.apply_rule_metadata_updates(metadata_updates)
+
+    def reads_source_model(self, rule=None):
+        """Returns True if the rule reads an attr that is not on the
+        visit or registered subject, that is, a value of its source
+        model, or if the rule does not declare its fields.
+        """
+        sources = attribute_sources.get_rule_sources(
+            rule=rule,
+            visit_model_cls=self.visit.__class__,
+            registered_subject_model_cls=django_apps.get_app_config(
+                'edc_registration').model)
+        return sources is None or REFERENCE in sources
+
+    def get_default_metadata_update(self, rule_group=None, metadata_update=None):
+        """Returns the metadata update or, if it has no entry status,
+        a copy with the entry status the visit schedule declares for
+        the target CRF or requisition panel.
+        """
+        if metadata_update.entry_status is not None:
+            return metadata_update
+        if metadata_update.target_panel:
+            panel_name = metadata_update.target_panel.name
+            forms = [f for f in rule_group.requisitions_for_visit(self.visit)
+                     if f.panel.name == panel_name]
+        else:
+            forms = [f for f in rule_group.crfs_for_visit(self.visit)
+                     if f.model == metadata_update.target_model]
+        if not forms:
+            return metadata_update
+        return metadata_update._replace(
+            entry_status=REQUIRED if forms[0].required else NOT_REQUIRED)
+
+    def get_rule_metadata_updates(self, rule_reference=None, target_model=None,
+                                  panel_name=None):
+        """Returns a list of (rule_group, MetadataUpdate) after running
+        one rule, optionally for only one target model or panel.
+
+        See the rule group's `get_rule_metadata_updates`.
+        """
+        rule, rule_group = rule_reference.rule, rule_reference.rule_group
+        _, updates = rule_group.get_rule_metadata_updates(rule=rule, visit=self.visit)
+        return [(rule_group, metadata_update) for metadata_update in updates
+                if (not target_model or metadata_update.target_model == target_model)
+                and (not panel_name or getattr(
+                    metadata_update.target_panel, 'name', None) == panel_name)]
+
+    @staticmethod
+    def get_metadata_key(metadata_update=None):
+        """Returns the key of the metadata object of a metadata
+        update; the target model or, for a requisition, a tuple of
+        (target_model, panel name), as in the registry snapshot.
+        """
+        panel_name = getattr(
+            metadata_update.target_panel, 'name', metadata_update.target_panel)
+        if panel_name:
+            return (metadata_update.target_model, panel_name)
+        return metadata_update.target_model
+
+    @staticmethod
+    def get_ordered_metadata_updates(metadata_updates=None):
+        """Returns a list of (rule_group, MetadataUpdate) with one
+        update per target model or panel, sorted by target model and
+        panel name.
+
+        As if applied in order, the last update wins. An update
+        without an entry status, i.e. DO_NOTHING or no value, does
+        not replace an earlier one.
+        """
+        ordered = OrderedDict()
+        for rule_group, metadata_update in metadata_updates:
+            key = (metadata_update.target_model,
+                   getattr(metadata_update.target_panel, 'name', None) or '')
+            if metadata_update.entry_status is None and key in ordered:
+                continue
+            ordered[key] = (rule_group, metadata_update)
+        return [ordered[key] for key in sorted(ordered)]
+
+    def apply_rule_metadata_updates(self, metadata_updates=None):
+        """Applies a list of (rule_group, MetadataUpdate) in one
+        transaction.
+
+        Updates are applied in the order of
+        `get_ordered_metadata_updates` so that concurrent evaluations
+        for the same visit lock metadata rows in the same order.
+
+        Returns an ordered dictionary of {key: metadata object}, see
+        `get_metadata_key`.
+        """
+        metadata_objects = OrderedDict()
+        with transaction.atomic():
+            for rule_group, metadata_update in self.get_ordered_metadata_updates(
+                    metadata_updates):
+                for metadata_obj in rule_group.update_metadata(
+                        visit=self.visit, metadata_updates=[metadata_update]).values():
+                    metadata_objects.update(
+                        {self.get_metadata_key(metadata_update): metadata_obj})
+        return metadata_objects
+
+    async def aevaluate_rules(self, deferred=None):
+        """Evaluates rules without blocking the event loop and returns
+        what `evaluate_rules` returns.
+
+        The registered subject and reference values are prefetched
+        concurrently, see `aprefetch`. Rule groups are then evaluated
+        from the prefetched values and the metadata updates applied
+        in one `sync_to_async` call and transaction. Evaluation is
+        not split per rule group since, once the values are loaded,
+        it only runs Python code.
+        """
+        from asgiref.sync import sync_to_async
+
+        deferred = self.deferred if deferred is None else deferred
+        if deferred is None:
+            deferred = await sync_to_async(is_deferred)()
+        if deferred:
+            return await sync_to_async(self.evaluate_rules)(deferred=True)
+        context = EvaluationContext(snapshot=site_metadata_rules.snapshot)
+        await self.aprefetch(context=context)
+        return await sync_to_async(
+            self._evaluate_rules, thread_sensitive=True)(context=context)
+
+    def _evaluate_rules(self, context=None):
+        with evaluation_context(context=context):
+            return self.evaluate_rules(deferred=False)
+
+    async def aprefetch(self, context=None):
+        """Loads the registered subject and the reference values read
+        by the visit's rule groups into the evaluation context with
+        `asyncio.gather`.
+
+        Reads run concurrently, each in its own thread and database
+        connection, if `async_thread_sensitive` is False. Otherwise
+        they run one after another on the shared sync thread, e.g.
+        inside a transaction or a test case.
+        """
+        from asgiref.sync import sync_to_async
+
+        rule_groups = self.get_rule_groups(snapshot=context.snapshot)
+        references = set()
+        for rule_group in rule_groups:
+            for rule in rule_group.get_rules():
+                if rule.source_model and rule.reference_getter_cls:
+                    references.update([
+                        (rule.reference_getter_cls, rule.source_model, field_name)
+                        for field_name in rule.field_names
+                        if not hasattr(self.visit, field_name)])
+        await asyncio.gather(
+            sync_to_async(
+                self._get_registered_subject,
+                thread_sensitive=self.async_thread_sensitive)(context),
+            *[sync_to_async(
+                self._get_reference,
+                thread_sensitive=self.async_thread_sensitive)(context, *reference)
+              for reference in sorted(references, key=lambda r: r[1:])])
+
+    def _get_registered_subject(self, context=None):
+        model_cls = django_apps.get_app_config('edc_registration').model
+        try:
+            context.registered_subjects.update({
+                self.visit.subject_identifier: model_cls.objects.get(
+                    subject_identifier=self.visit.subject_identifier)})
+        except ObjectDoesNotExist:
+            # raised again by the rule evaluator
+            pass
+        finally:
+            if not self.async_thread_sensitive:
+                connections.close_all()
 
-    def evaluate_rules(self):
-        for rule_group in site_metadata_rules.registry.get(self.app_label, []):
-            rule_group.evaluate_rules(visit=self.visit)
+    def _get_reference(self, context=None, reference_getter_cls=None,
+                       name=None, field_name=None):
+        try:
+            context.get_reference(
+                reference_getter_cls=reference_getter_cls,
+                field_name=field_name,
+                name=name,
+                subject_identifier=self.visit.subject_identifier,
+                report_datetime=self.visit.report_datetime,
+                visit_code=self.visit.visit_code)
+        except ReferenceObjectDoesNotExist:
+            pass
+        finally:
+            if not self.async_thread_sensitive:
+                connections.close_all()
@@ -0,0 +1,116 @@
+from django.db import models
+
+from .metadata_rule_evaluator import MetadataRuleEvaluator
+
+
+class MetadataRulesModelMixin(models.Model):
+
+    """A model mixin for a rule group source model that passes the
+    model and, for a requisition, its panel to the rule evaluator.
+
+    Requisition rule groups with this model as source model then only
+    run the rules declared for the saved panel, see
+    `RequisitionRule.source_panel`.
+
+    Declare before `UpdatesCrfMetadataModelMixin` or
+    `UpdatesRequisitionMetadataModelMixin`.
+    """
+
+    metadata_rule_evaluator_cls = MetadataRuleEvaluator
+
+    @property
+    def metadata_rules_source_panel(self):
+        """Returns the panel name of a requisition or None.
+        """
+        return (getattr(self, 'panel_name', None)
+                or getattr(getattr(self, 'panel', None), 'name', None))
+
+    def get_metadata_rule_evaluator_options(self):
+        return dict(
+            visit=self.visit,
+            source_model=self._meta.label_lower,
+            source_panel=self.metadata_rules_source_panel)
+
+    def run_metadata_rules_for_crf(self):
+        """Runs the metadata rules for the visit.
+
+        Called by the edc_metadata post_save and post_delete signals.
+        """
+        self.metadata_rule_evaluator_cls(
+            **self.get_metadata_rule_evaluator_options()).evaluate_rules()
+
+    class Meta:
+        abstract = True
+
+
+class MetadataRulesChangedFieldsModelMixin(MetadataRulesModelMixin):
+
+    """A model mixin for a rule group source model that also passes
+    the fields changed since the instance was loaded to the rule
+    evaluator.
+
+    Declare before `UpdatesCrfMetadataModelMixin` or
+    `UpdatesRequisitionMetadataModelMixin`.
+
+    If the instance is new or was loaded with deferred fields,
+    changed fields are unknown and all rule groups are evaluated.
+
+    If the instance is deleted, only the rules of rule groups with
+    this model as source model are evaluated.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def changed_fields(self):
+        """Returns a set of field names changed since the instance
+        was loaded or saved, or None if not known.
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+        changed_fields = set()
+        for field in self._meta.concrete_fields:
+            if field.attname not in loaded_values:
+                return None
+            if getattr(self, field.attname) != loaded_values.get(field.attname):
+                changed_fields.add(field.name)
+        return changed_fields
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields}
+
+    def delete(self, *args, **kwargs):
+        self._loaded_values = None
+        self._deleting = True
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            self._deleting = False
+
+    def run_metadata_rules_for_crf(self):
+        """Runs the metadata rules for the visit.
+
+        Called by the edc_metadata post_save and post_delete signals.
+        """
+        if getattr(self, '_deleting', False):
+            self.metadata_rule_evaluator_cls(
+                visit=self.visit).evaluate_rules_for_deleted(
+                    source_model=self._meta.label_lower)
+        else:
+            super().run_metadata_rules_for_crf()
+
+    def get_metadata_rule_evaluator_options(self):
+        options = super().get_metadata_rule_evaluator_options()
+        options.update(changed_fields=self.changed_fields)
+        return options
+
+    class Meta:
+        abstract = True
@@ -1,5 +1,12 @@
+import re
+import weakref
+
+from django.db.models import Q
 from edc_reference.reference import ReferenceObjectDoesNotExist
 
+from .attribute_sources import attribute_sources
+from .evaluation_context import get_evaluation_context
+
 
 class PredicateError(Exception):
     pass
@@ -9,29 +16,195 @@ class NoValueError(Exception):
     pass
 
 
+class PredicateNotTranslatable(PredicateError):
+    pass
+
+
+_interned = weakref.WeakValueDictionary()
+
+
+def hashable(value=None):
+    """Returns the value if hashable, otherwise its repr.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def get_context_key(context=None, visit=None, source_model=None,
+                    reference_getter_cls=None, **kwargs):
+    """Returns a tuple identifying the inputs of a predicate in an
+    evaluation context or None if there is no context or the visit
+    is not saved.
+    """
+    if context is None or getattr(visit, 'pk', None) is None:
+        return None
+    return (visit.__class__, visit.pk, source_model, reference_getter_cls,
+            source_model in context.absent_source_models)
+
+
+def intern_predicate(predicate=None):
+    """Returns the first registered predicate structurally equal to
+    `predicate`, or `predicate` if it is the first.
+
+    Predicates are held by weak reference, so a predicate is dropped
+    once no rule refers to it, e.g. after its rule group is
+    unregistered or reloaded.
+    """
+    if not isinstance(predicate, BasePredicate):
+        return predicate
+    return _interned.setdefault(predicate.structure, predicate)
+
+
 class BasePredicate:
 
+    """Base class for predicate classes.
+
+    Predicates are compared by structure, so `P('gender', 'eq', MALE)`
+    in one rule equals the same predicate in another rule. Within an
+    evaluation context, each unique predicate and attr value is
+    evaluated once per visit and source model and shared by all
+    rules.
+    """
+
+    # kwargs holding instances that are already loaded
+    loaded_instances = ['visit', 'registered_subject']
+
+    def __call__(self, **kwargs):
+        context = get_evaluation_context()
+        key = self.get_context_key(context=context, **kwargs)
+        if key is None:
+            return self.evaluate(**kwargs)
+        try:
+            result = context.predicate_results[key]
+        except KeyError:
+            try:
+                result = self.evaluate(**kwargs)
+            except NoValueError as e:
+                result = e
+            context.predicate_results[key] = result
+        if isinstance(result, NoValueError):
+            raise result
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, BasePredicate):
+            return NotImplemented
+        return self.structure == other.structure
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self.structure)
+            return self._hash
+
+    @property
+    def structure(self):
+        """Returns a hashable tuple that identifies the predicate.
+        """
+        raise NotImplementedError()
+
+    def evaluate(self, **kwargs):
+        raise NotImplementedError()
+
+    def get_context_key(self, context=None, **kwargs):
+        """Returns a key for the predicate result in the evaluation
+        context or None.
+        """
+        key = get_context_key(context=context, **kwargs)
+        return None if key is None else (self, ) + key
+
+    def __and__(self, other):
+        if not isinstance(other, BasePredicate):
+            return NotImplemented
+        return AndPredicate(self, other)
+
+    def __or__(self, other):
+        if not isinstance(other, BasePredicate):
+            return NotImplemented
+        return OrPredicate(self, other)
+
+    def __invert__(self):
+        return NotPredicate(self)
+
+    def to_q(self, field_map=None):
+        """Returns a Q object equivalent to the predicate or raises
+        PredicateNotTranslatable.
+
+        `field_map` maps an attr to an ORM path, e.g.
+        {'gender': 'subject_visit__appointment__registered_subject__gender'}.
+        """
+        raise PredicateNotTranslatable(
+            f'Predicate cannot be translated to a Q object. Got {repr(self)}.')
+
+    def get_cost(self, **kwargs):
+        """Returns 0 if all attrs are found on a loaded instance, that
+        is the visit or registered subject, otherwise 1 since the
+        value requires a reference lookup.
+        """
+        for attr in self.attrs:
+            if not any([attribute_sources.instance_has_attr(kwargs.get(k), attr)
+                        for k in self.loaded_instances]):
+                return 1
+        return 0
+
     def get_value(self, attr=None, source_model=None, reference_getter_cls=None, **kwargs):
+        """Returns the value of attr, fetched once per visit and
+        source model within an evaluation context.
+
+        See `_get_value`.
+        """
+        context = get_evaluation_context()
+        key = get_context_key(
+            context=context, source_model=source_model,
+            reference_getter_cls=reference_getter_cls, **kwargs)
+        if key is None:
+            return self._get_value(
+                attr=attr, source_model=source_model,
+                reference_getter_cls=reference_getter_cls, **kwargs)
+        key = (attr, ) + key
+        try:
+            value = context.values[key]
+        except KeyError:
+            try:
+                value = self._get_value(
+                    attr=attr, source_model=source_model,
+                    reference_getter_cls=reference_getter_cls, **kwargs)
+            except NoValueError as e:
+                value = e
+            context.values[key] = value
+        if isinstance(value, NoValueError):
+            raise value
+        return value
+
+    def _get_value(self, attr=None, source_model=None, reference_getter_cls=None, **kwargs):
         """Returns a value by checking for the attr on each arg.
 
         Each arg in args may be a model instance, queryset, or None.
 
         A NoValueError is raised if attr is not found on any "instance".
         in kwargs.
+
+        Where attr is found is resolved once per class, see
+        `attribute_sources`. If the attr raises an AttributeError on
+        the instance, e.g. a reverse relation without a related object,
+        each instance is checked instead, see `_get_instance_value`.
         """
         value = None
-        found_on_instance = None
+        found = False
         for instance in kwargs.values():
-            try:
-                getattr(instance, attr)
-            except AttributeError:
-                pass
-            else:
-                found_on_instance = instance
+            if attribute_sources.instance_has_attr(instance, attr):
+                try:
+                    value = getattr(instance, attr)
+                except AttributeError:
+                    found, value = self._get_instance_value(attr=attr, **kwargs)
+                else:
+                    found = True
                 break
-        if found_on_instance:
-            value = getattr(found_on_instance, attr)
-        else:
+        if not found:
             visit = kwargs.get('visit')
             opts = dict(
                 field_name=attr,
@@ -39,8 +212,13 @@ class BasePredicate:
                 subject_identifier=visit.subject_identifier,
                 report_datetime=visit.report_datetime,
                 visit_code=visit.visit_code)
+            context = get_evaluation_context()
             try:
-                reference = reference_getter_cls(**opts)
+                if context:
+                    reference = context.get_reference(
+                        reference_getter_cls=reference_getter_cls, **opts)
+                else:
+                    reference = reference_getter_cls(**opts)
             except ReferenceObjectDoesNotExist as e:
                 raise NoValueError(
                     f'No value found for {attr}. Given {kwargs}. Got {e}.')
@@ -52,6 +230,17 @@ class BasePredicate:
                         f'No value found for {attr}. Given {kwargs}')
         return value
 
+    def _get_instance_value(self, attr=None, **kwargs):
+        """Returns a tuple of (found, value) for the first instance
+        in kwargs where getting attr does not raise an AttributeError.
+        """
+        for instance in kwargs.values():
+            try:
+                return True, getattr(instance, attr)
+            except AttributeError:
+                pass
+        return False, None
+
 
 class P(BasePredicate):
 
@@ -63,6 +252,14 @@ class P(BasePredicate):
         predicate = P('gender', 'eq', 'MALE')
         predicate = P('referral_datetime', 'is not', None)
         predicate = P('age', '<=', 64)
+        predicate = P('icd10', 'in', ['A15', 'A16', 'A17'])
+        predicate = P('age', 'between', (18, 64))
+        predicate = P('icd10', 'regex', r'^A1[5-9]')
+
+    For 'in' and 'not in' the expected values are kept as a frozenset,
+    for 'between' as a tuple of (lower, upper), both inclusive, and
+    for 'regex' as a compiled pattern matched with `search`. Of the
+    regex flags, only `re.IGNORECASE` can be translated with `to_q`.
     """
 
     funcs = {
@@ -81,24 +278,119 @@ class P(BasePredicate):
         '==': lambda x, y: True if x == y else False,
         'neq': lambda x, y: True if x != y else False,
         '!=': lambda x, y: True if x != y else False,
+        'in': lambda x, y: True if x in y else False,
+        'not in': lambda x, y: True if x not in y else False,
+        'between': lambda x, y: True if y[0] <= x <= y[1] else False,
+        'regex': lambda x, y: True if x is not None and y.search(str(x)) else False,
+    }
+
+    lookups = {
+        'gt': 'gt',
+        '>': 'gt',
+        'gte': 'gte',
+        '>=': 'gte',
+        'lt': 'lt',
+        '<': 'lt',
+        'lte': 'lte',
+        '<=': 'lte',
+        'eq': 'exact',
+        'equals': 'exact',
+        '==': 'exact',
+        'in': 'in',
+        'between': 'range',
+        'regex': 'regex',
+    }
+
+    negated_lookups = {
+        'neq': 'exact',
+        '!=': 'exact',
+        'not in': 'in',
     }
 
     def __init__(self, attr, operator, expected_value):
         self.attr = attr
-        self.expected_value = expected_value
+        self.attrs = (attr, )
         self.func = self.funcs.get(operator)
         if not self.func:
             raise PredicateError(f'Invalid operator. Got {operator}.')
         self.operator = operator
+        self.expected_value = self.get_expected_value(expected_value)
+
+    def get_expected_value(self, expected_value=None):
+        """Returns the expected value prepared for the operator.
+        """
+        try:
+            if self.operator in ['in', 'not in']:
+                if isinstance(expected_value, str):
+                    raise TypeError('Expected a collection, not a string')
+                return frozenset(expected_value)
+            elif self.operator == 'between':
+                if not isinstance(expected_value, (list, tuple)) or len(expected_value) != 2:
+                    raise TypeError('Expected a list or tuple of (lower, upper)')
+                lower, upper = expected_value
+                if not lower <= upper:
+                    raise ValueError('Expected lower <= upper')
+                return (lower, upper)
+            elif self.operator == 'regex':
+                if hasattr(expected_value, 'search'):
+                    return expected_value
+                return re.compile(expected_value)
+        except (TypeError, ValueError, re.error) as e:
+            raise PredicateError(
+                f'Invalid expected value for operator \'{self.operator}\'. '
+                f'Got {expected_value}. {e}')
+        return expected_value
+
+    def get_lookup(self):
+        """Returns the ORM lookup for the operator.
+
+        A regex compiled with `re.IGNORECASE` uses `iregex`, other
+        flags cannot be translated.
+        """
+        if self.operator == 'regex':
+            flags = self.expected_value.flags & ~(re.UNICODE | re.IGNORECASE)
+            if flags:
+                raise PredicateNotTranslatable(
+                    f'Regex flags cannot be translated. Got {repr(self)}.')
+            if self.expected_value.flags & re.IGNORECASE:
+                return 'iregex'
+        return self.lookups[self.operator]
+
+    def get_lookup_value(self):
+        """Returns the expected value for the ORM lookup.
+        """
+        if self.operator in ['in', 'not in']:
+            return list(self.expected_value)
+        elif self.operator == 'regex':
+            return self.expected_value.pattern
+        return self.expected_value
 
     def __repr__(self):
         return (f'{self.__class__.__name__}({self.attr}, {self.operator}, '
                 f'{self.expected_value})')
 
-    def __call__(self, **kwargs):
+    @property
+    def structure(self):
+        return (self.__class__, self.attr, self.operator,
+                type(self.expected_value), hashable(self.expected_value))
+
+    def evaluate(self, **kwargs):
         value = self.get_value(attr=self.attr, **kwargs)
         return self.func(value, self.expected_value)
 
+    def to_q(self, field_map=None):
+        path = (field_map or {}).get(self.attr, self.attr)
+        if self.operator in ['is', 'is not']:
+            if self.expected_value is None:
+                return Q(**{f'{path}__isnull': self.operator == 'is'})
+            if self.operator == 'is':
+                return Q(**{f'{path}__exact': self.expected_value})
+            return ~Q(**{f'{path}__exact': self.expected_value})
+        if self.operator in self.negated_lookups:
+            return ~Q(**{f'{path}__{self.negated_lookups[self.operator]}':
+                         self.get_lookup_value()})
+        return Q(**{f'{path}__{self.get_lookup()}': self.get_lookup_value()})
+
 
 class PF(BasePredicate):
     """
@@ -126,7 +418,7 @@ class PF(BasePredicate):
         self.attrs = attrs
         self.func = func
 
-    def __call__(self, **kwargs):
+    def evaluate(self, **kwargs):
         values = []
         for attr in self.attrs:
             values.append(self.get_value(attr=attr, **kwargs))
@@ -134,3 +426,130 @@ class PF(BasePredicate):
 
     def __repr__(self):
         return f'{self.__class__.__name__}({self.attrs}, {self.func})'
+
+    @property
+    def structure(self):
+        return (self.__class__, tuple(self.attrs), self.func)
+
+
+class BaseCompositePredicate(BasePredicate):
+
+    """Base class for predicates composed of other predicates.
+
+    Child predicates are evaluated lazily, cheapest first (see
+    `get_cost`), and evaluation stops as soon as the outcome is
+    known. Children of equal cost are evaluated in the order declared.
+    """
+
+    def __init__(self, *predicates):
+        self.predicates = []
+        for predicate in predicates:
+            if not isinstance(predicate, BasePredicate):
+                raise PredicateError(
+                    f'Expected a predicate class such as "P" or "PF". Got {predicate}.')
+            if isinstance(predicate, self.__class__):
+                self.predicates.extend(predicate.predicates)
+            else:
+                self.predicates.append(predicate)
+        attrs = []
+        for predicate in self.predicates:
+            attrs.extend([a for a in predicate.attrs if a not in attrs])
+        self.attrs = tuple(attrs)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'{", ".join([repr(p) for p in self.predicates])})')
+
+    @property
+    def structure(self):
+        return (self.__class__, tuple(self.predicates))
+
+    def get_cost(self, **kwargs):
+        return max([p.get_cost(**kwargs) for p in self.predicates])
+
+    def to_q(self, field_map=None):
+        q = None
+        for predicate in self.predicates:
+            if q is None:
+                q = predicate.to_q(field_map=field_map)
+            else:
+                q = self.combine(q, predicate.to_q(field_map=field_map))
+        return q
+
+    def ordered(self, **kwargs):
+        """Returns child predicates sorted cheapest first.
+        """
+        return sorted(self.predicates, key=lambda p: p.get_cost(**kwargs))
+
+
+class AndPredicate(BaseCompositePredicate):
+
+    """A predicate that is True if all child predicates are True.
+
+    For example:
+
+        predicate = P('gender', 'eq', FEMALE) & P('f1', 'eq', 'car')
+    """
+
+    def evaluate(self, **kwargs):
+        for predicate in self.ordered(**kwargs):
+            if not predicate(**kwargs):
+                return False
+        return True
+
+    @staticmethod
+    def combine(q1, q2):
+        return q1 & q2
+
+
+class OrPredicate(BaseCompositePredicate):
+
+    """A predicate that is True if any child predicate is True.
+
+    For example:
+
+        predicate = P('f1', 'eq', 'car') | P('f1', 'eq', 'bicycle')
+    """
+
+    def evaluate(self, **kwargs):
+        for predicate in self.ordered(**kwargs):
+            if predicate(**kwargs):
+                return True
+        return False
+
+    @staticmethod
+    def combine(q1, q2):
+        return q1 | q2
+
+
+class NotPredicate(BasePredicate):
+
+    """A predicate that negates another predicate.
+
+    For example:
+
+        predicate = ~P('f1', 'eq', 'car')
+    """
+
+    def __init__(self, predicate):
+        if not isinstance(predicate, BasePredicate):
+            raise PredicateError(
+                f'Expected a predicate class such as "P" or "PF". Got {predicate}.')
+        self.predicate = predicate
+        self.attrs = predicate.attrs
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({repr(self.predicate)})'
+
+    @property
+    def structure(self):
+        return (self.__class__, self.predicate)
+
+    def evaluate(self, **kwargs):
+        return not self.predicate(**kwargs)
+
+    def to_q(self, field_map=None):
+        return ~self.predicate.to_q(field_map=field_map)
+
+    def get_cost(self, **kwargs):
+        return self.predicate.get_cost(**kwargs)
@@ -1,6 +1,8 @@
 from django.apps import apps as django_apps
 from edc_reference import LongitudinalRefset, site_reference_configs
 
+from .evaluation_context import get_evaluation_context
+
 
 class PredicateCollection:
 
@@ -22,6 +24,10 @@ class PredicateCollection:
 
     app_label = 'edc_metadata'
     visit_model = None
+    refset_cls = LongitudinalRefset
+    # options that identify a refset. Other options, e.g.
+    # report_datetime, differ per visit and are not read by the refset.
+    refset_key_options = ['name', 'subject_identifier', 'visit_model']
 
     def __init__(self):
         self.reference_model_cls = django_apps.get_model(
@@ -43,10 +49,20 @@ class PredicateCollection:
             return refsets.fieldset(field_name).all().values
 
     def refsets(self, reference_name=None, **options):
+        """Returns a LongitudinalRefset.
+
+        Within an evaluation pass, the refset is created once per
+        subject and reference name, see `refset_key_options`, and
+        shared, e.g. by all visits of a subject evaluated by
+        `SubjectMetadataRuleEvaluator`.
+        """
         opts = dict(
             name=reference_name,
             visit_model=self.visit_model,
             reference_model_cls=self.reference_model_cls,
             **options)
-        refsets = LongitudinalRefset(**opts)
-        return refsets
+        context = get_evaluation_context()
+        if context:
+            return context.get_refset(
+                refset_cls=self.refset_cls, key_options=self.refset_key_options, **opts)
+        return self.refset_cls(**opts)
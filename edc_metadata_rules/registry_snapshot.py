@@ -0,0 +1,122 @@
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+
+RuleReference = namedtuple(
+    'RuleReference', 'rule rule_group source_model field_names')
+
+
+class RegistrySnapshotError(Exception):
+    pass
+
+
+class RegistrySnapshot:
+
+    """An immutable copy of the site registry.
+
+    A new snapshot is published by the site whenever the registry
+    changes. Evaluation reads rule groups from a snapshot so it never
+    sees a registry that is being changed.
+
+    `targets` is a reverse index of {target: (RuleReference, ...)}
+    where target is a target model or, for requisitions, a tuple of
+    (target model, panel name). `sources` is an index of
+    {source_model: (RuleReference, ...)}. References are in registry
+    order.
+    """
+
+    def __init__(self, registry=None, version=None):
+        registry = MappingProxyType(OrderedDict(
+            (app_label, tuple(rule_groups))
+            for app_label, rule_groups in (registry or {}).items()))
+        object.__setattr__(self, 'registry', registry)
+        object.__setattr__(self, 'version', version or 0)
+        object.__setattr__(self, 'targets', self._get_targets(registry))
+        object.__setattr__(self, 'sources', self._get_sources(registry))
+        object.__setattr__(self, '_visit_rule_groups', {})
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(version={self.version})'
+
+    def __setattr__(self, name, value):
+        raise RegistrySnapshotError(
+            f'Registry snapshot is read-only. Got {name}. See {repr(self)}.')
+
+    def __delattr__(self, name):
+        raise RegistrySnapshotError(
+            f'Registry snapshot is read-only. Got {name}. See {repr(self)}.')
+
+    def rule_groups(self, app_label=None):
+        """Returns a tuple of rule groups for the app_label.
+        """
+        return self.registry.get(app_label, ())
+
+    def rule_groups_for_visit(self, app_label=None, visit=None):
+        """Returns a tuple of rule groups for the app_label that apply
+        to the visit's visit schedule, schedule and visit code.
+
+        The result is kept per (app_label, visit_schedule_name,
+        schedule_name, visit_code).
+        """
+        key = (app_label,
+               getattr(visit, 'visit_schedule_name', None),
+               getattr(visit, 'schedule_name', None),
+               getattr(visit, 'visit_code', None))
+        try:
+            return self._visit_rule_groups[key]
+        except KeyError:
+            rule_groups = tuple(
+                rule_group for rule_group in self.rule_groups(app_label)
+                if rule_group._meta.in_scope(
+                    visit_schedule_name=key[1], schedule_name=key[2], visit_code=key[3]))
+            self._visit_rule_groups[key] = rule_groups
+            return rule_groups
+
+    def rules_for_target(self, target_model=None, target_panel=None):
+        """Returns a tuple of RuleReference for rules that update
+        metadata for the target model or requisition panel.
+
+        `target_panel` may be a panel or a panel name.
+        """
+        if target_panel:
+            key = (target_model, getattr(target_panel, 'name', target_panel))
+        else:
+            key = target_model
+        return self.targets.get(key, ())
+
+    def rules_for_source(self, source_model=None):
+        """Returns a tuple of RuleReference for rules of rule groups
+        with the given source model.
+        """
+        return self.sources.get(source_model, ())
+
+    @staticmethod
+    def _get_sources(registry=None):
+        sources = OrderedDict()
+        for rule_groups in registry.values():
+            for rule_group in rule_groups:
+                for rule in rule_group.get_rules():
+                    if rule.source_model:
+                        sources.setdefault(rule.source_model, []).append(RuleReference(
+                            rule, rule_group, rule.source_model, tuple(rule.field_names)))
+        return MappingProxyType(OrderedDict(
+            (key, tuple(rule_references)) for key, rule_references in sources.items()))
+
+    @staticmethod
+    def _get_targets(registry=None):
+        targets = OrderedDict()
+        for rule_groups in registry.values():
+            for rule_group in rule_groups:
+                for rule in rule_group.get_rules():
+                    rule_reference = RuleReference(
+                        rule, rule_group, rule.source_model, tuple(rule.field_names))
+                    target_panels = getattr(rule, 'target_panels', None)
+                    for target_model in rule.target_models:
+                        if target_panels:
+                            keys = [(target_model, panel.name) for panel in target_panels]
+                        else:
+                            keys = [target_model]
+                        for key in keys:
+                            targets.setdefault(key, []).append(rule_reference)
+        return MappingProxyType(OrderedDict(
+            (key, tuple(rule_references)) for key, rule_references in targets.items()))
@@ -22,5 +22,6 @@ class RequisitionRule(Rule):
     def __init__(self, source_panel=None, target_panels=None, **kwargs):
         self.metadata_category = REQUISITION
         self.target_panels = [p for p in target_panels]
+        self.target_panel_names = frozenset([p.name for p in self.target_panels])
         self.source_panel = source_panel
         super().__init__(**kwargs)
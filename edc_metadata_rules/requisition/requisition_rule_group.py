@@ -1,7 +1,7 @@
 from collections import OrderedDict, namedtuple
 from edc_metadata import RequisitionMetadataUpdater
 
-from ..rule_group import RuleGroup
+from ..rule_group import RuleGroup, MetadataUpdate
 from ..rule_group_meta_options import RuleGroupMetaOptions
 from ..rule_group_metaclass import RuleGroupMetaclass
 
@@ -54,6 +54,18 @@ class RequisitionMetaclass(RuleGroupMetaclass):
 
     rule_group_meta = RequisitionRuleGroupMetaOptions
 
+    def __new__(cls, name, bases, attrs):
+        new_cls = super().__new__(cls, name, bases, attrs)
+        if '_meta' in new_cls.__dict__:
+            # index rules by source panel name, None if no source panel
+            rules_by_source_panel = OrderedDict()
+            for rule in new_cls._meta.options.get('rules'):
+                rules_by_source_panel.setdefault(
+                    getattr(rule.source_panel, 'name', None), []).append(rule)
+            new_cls._meta.rules_by_source_panel = {
+                k: tuple(v) for k, v in rules_by_source_panel.items()}
+        return new_cls
+
 
 class RequisitionRuleGroup(RuleGroup, metaclass=RequisitionMetaclass):
 
@@ -73,29 +85,62 @@ class RequisitionRuleGroup(RuleGroup, metaclass=RequisitionMetaclass):
         return requisitions
 
     @classmethod
-    def evaluate_rules(cls, visit=None):
+    def get_rules(cls, source_panel=None):
+        """Returns a tuple of rules.
+
+        If `source_panel` (a panel or panel name) is given and the
+        source model is the requisition model, only rules declared
+        with that source panel are returned.
+        """
+        if source_panel is None or cls._meta.source_model != cls._meta.requisition_model:
+            return super().get_rules()
+        return cls._meta.rules_by_source_panel.get(
+            getattr(source_panel, 'name', source_panel), ())
+
+    @classmethod
+    def evaluate_rules(cls, visit=None, source_panel=None):
         """Returns a tuple of (rule_results, metadata_objects) where
         rule_results ...
 
         Metadata must exist.
         """
-        rule_results = OrderedDict()
-        metadata_objects = OrderedDict()
-        for rule in cls._meta.options.get('rules'):
-            rule_results[str(rule)] = OrderedDict()
-            for target_model, entry_status in rule.run(visit=visit).items():
-                rule_results[str(rule)].update({target_model: []})
-                for target_panel in rule.target_panels:
-                    # only do something if target_panel is in
-                    # visit.requisitions
-                    if target_panel in [r.panel for r in cls.requisitions_for_visit(visit)]:
-                        metadata_updater = cls.metadata_updater_cls(
-                            visit=visit,
-                            target_model=target_model,
-                            target_panel=target_panel)
-                        metadata_obj = metadata_updater.update(
-                            entry_status=entry_status)
-                        metadata_objects.update({target_panel: metadata_obj})
-                        rule_results[str(rule)][target_model].append(
-                            RuleResult(target_panel, entry_status))
+        rule_results, metadata_updates = cls.get_metadata_updates(
+            visit=visit, source_panel=source_panel)
+        metadata_objects = cls.update_metadata(
+            visit=visit, metadata_updates=metadata_updates)
         return rule_results, metadata_objects
+
+    @classmethod
+    def get_metadata_updates(cls, visit=None, source_panel=None):
+        rule_results = OrderedDict()
+        metadata_updates = []
+        panel_names = set([r.panel.name for r in cls.requisitions_for_visit(visit)])
+        for rule in cls.get_rules(source_panel=source_panel):
+            rule_results[str(rule)], updates = cls.get_rule_metadata_updates(
+                rule=rule, visit=visit, panel_names=panel_names)
+            metadata_updates.extend(updates)
+        return rule_results, metadata_updates
+
+    @classmethod
+    def get_rule_metadata_updates(cls, rule=None, visit=None, panel_names=None):
+        """Returns a tuple of (rule_result, metadata_updates) after
+        running one rule.
+
+        Only target panels scheduled for the visit are updated.
+        """
+        if panel_names is None:
+            panel_names = set([r.panel.name for r in cls.requisitions_for_visit(visit)])
+        metadata_updates = []
+        rule_result = OrderedDict()
+        target_panel_names = rule.target_panel_names & panel_names
+        for target_model, entry_status in rule.run(visit=visit).items():
+            rule_result.update({target_model: []})
+            for target_panel in rule.target_panels:
+                # only do something if target_panel is in
+                # visit.requisitions
+                if target_panel.name in target_panel_names:
+                    metadata_updates.append(
+                        MetadataUpdate(target_model, target_panel, entry_status))
+                    rule_result[target_model].append(
+                        RuleResult(target_panel, entry_status))
+        return rule_result, metadata_updates
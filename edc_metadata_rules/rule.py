@@ -1,3 +1,5 @@
+import copy
+
 from collections import OrderedDict
 
 from .logic import Logic
@@ -10,8 +12,15 @@ class RuleError(Exception):
 
 class Rule:
 
+    """A class to declare a rule.
+
+    Once the rule group metaclass has prepared the rule, it is frozen
+    since the same instance is shared by all threads.
+    """
+
     rule_evaluator_cls = RuleEvaluator
     logic_cls = Logic
+    _frozen = False
 
     def __init__(self, predicate=None, consequence=None, alternative=None):
         self._logic = self.logic_cls(
@@ -39,14 +48,37 @@ class Rule:
     def __str__(self):
         return f'{self.group}.{self.name}'
 
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise RuleError(
+                f'Rule is frozen and cannot be changed. Got {name}. See {repr(self)}.')
+        super().__setattr__(name, value)
+
+    def freeze(self):
+        super().__setattr__('_frozen', True)
+
+    def clone(self):
+        """Returns a shallow copy of this rule.
+
+        The predicate is shared with the original; the logic is copied
+        since the metaclass reassigns its predicate. Attrs set by the
+        metaclass are reassigned, not mutated, so the original is not
+        affected.
+        """
+        rule = copy.copy(self)
+        rule.__dict__.pop('_frozen', None)
+        rule._logic = copy.copy(self._logic)
+        rule.field_names = list(self.field_names)
+        return rule
+
     def run(self, visit=None):
         """Returns a dictionary of {target_model: entry_status, ...} updated
         by running the rule for each target model given a visit.
         """
         result = OrderedDict()
-        opts = {k: v for k, v in self.__dict__.items() if k.startswith != '_'}
+        opts = {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
         rule_evaluator = self.rule_evaluator_cls(
-            visit=visit, logic=self._logic, **opts)
+            visit=visit, logic=self._logic, rule=self, **opts)
         entry_status = rule_evaluator.result
         for target_model in self.target_models:
             result.update({target_model: entry_status})
@@ -3,7 +3,9 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from edc_metadata import DO_NOTHING
 
+from .evaluation_context import get_evaluation_context
 from .predicate import NoValueError
+from .subject_rule_cache import subject_rule_cache
 
 
 class RuleEvaluatorError(Exception):
@@ -21,16 +23,35 @@ class RuleEvaluator:
     Sets self.result to REQUIRED, NOT_REQUIRED or None.
 
     Set as a class attribute on Rule.
+
+    If the rule only reads registered subject attrs, the result is
+    evaluated once per subject and then read from the subject rule
+    cache without fetching the registered subject.
     """
 
-    def __init__(self, logic=None, visit=None, **kwargs):
+    def __init__(self, logic=None, visit=None, rule=None, **kwargs):
         self._registered_subject = None
         self.logic = logic
         self.result = None
         self.visit = visit
-        options = dict(
+        if rule and subject_rule_cache.is_subject_scoped(
+                rule=rule, visit=self.visit,
+                registered_subject_model_cls=self.registered_subject_model):
+            self.result = subject_rule_cache.get_result(
+                rule=rule, subject_identifier=self.visit.subject_identifier,
+                evaluate=lambda: self.evaluate(**self.get_options(**kwargs)))
+        else:
+            self.result = self.evaluate(**self.get_options(**kwargs))
+
+    def get_options(self, **kwargs):
+        return dict(
             visit=self.visit,
             registered_subject=self.registered_subject, **kwargs)
+
+    def evaluate(self, **options):
+        """Returns the consequence or alternative, or None if
+        DO_NOTHING or there is no value.
+        """
         try:
             predicate = self.logic.predicate(**options)
         except NoValueError:
@@ -38,10 +59,11 @@ class RuleEvaluator:
         else:
             if predicate:
                 if self.logic.consequence != DO_NOTHING:
-                    self.result = self.logic.consequence
+                    return self.logic.consequence
             else:
                 if self.logic.alternative != DO_NOTHING:
-                    self.result = self.logic.alternative
+                    return self.logic.alternative
+        return None
 
     @property
     def registered_subject_model(self):
@@ -51,14 +73,26 @@ class RuleEvaluator:
     @property
     def registered_subject(self):
         """Returns a registered subject model instance or raises.
+
+        The instance is shared by all rules in the current evaluation
+        context, if any.
         """
         if not self._registered_subject:
-            try:
-                self._registered_subject = self.registered_subject_model.objects.get(
-                    subject_identifier=self.visit.subject_identifier)
-            except ObjectDoesNotExist as e:
-                raise RuleEvaluatorRegisterSubjectError(
-                    f'Registered subject required for rule {repr(self)}. '
-                    f'subject_identifier=\'{self.visit.subject_identifier}\'. '
-                    f'Got {e}.')
+            context = get_evaluation_context()
+            subject_identifier = self.visit.subject_identifier
+            if context:
+                self._registered_subject = context.registered_subjects.get(
+                    subject_identifier)
+            if not self._registered_subject:
+                try:
+                    self._registered_subject = self.registered_subject_model.objects.get(
+                        subject_identifier=subject_identifier)
+                except ObjectDoesNotExist as e:
+                    raise RuleEvaluatorRegisterSubjectError(
+                        f'Registered subject required for rule {repr(self)}. '
+                        f'subject_identifier=\'{subject_identifier}\'. '
+                        f'Got {e}.')
+                if context:
+                    context.registered_subjects.update(
+                        {subject_identifier: self._registered_subject})
         return self._registered_subject
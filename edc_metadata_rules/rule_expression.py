@@ -0,0 +1,77 @@
+from django.db.models import Case, CharField, Value, When
+from edc_metadata import DO_NOTHING
+
+from .predicate import BasePredicate, PredicateNotTranslatable
+
+
+class RuleExpression:
+
+    """A class to translate a rule into an ORM expression so that the
+    database computes the rule outcome for many rows at once.
+
+    For example, for a rule group with source model CrfOne:
+
+        expression = RuleExpression(rule=rule)
+        if expression.translatable:
+            qs = CrfOne.objects.annotate(**{rule.name: expression.as_case()})
+
+    The outcome is the consequence or alternative, or None for
+    DO_NOTHING. As with `Rule.run`, there is no outcome for visits
+    without a source model instance since there is no row.
+    """
+
+    def __init__(self, rule=None, field_map=None):
+        self.rule = rule
+        self.field_map = field_map
+        try:
+            self.q = self.predicate.to_q(field_map=self.field_map)
+        except (PredicateNotTranslatable, AttributeError):
+            self.q = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(rule={repr(self.rule)})'
+
+    @property
+    def predicate(self):
+        return self.rule._logic.predicate
+
+    @property
+    def translatable(self):
+        """Returns True if the predicate is a predicate class that
+        can be translated, e.g. not a `PF` or a plain function.
+        """
+        return isinstance(self.predicate, BasePredicate) and self.q is not None
+
+    def as_case(self):
+        """Returns a Case expression that evaluates to the rule
+        outcome or raises PredicateNotTranslatable.
+        """
+        if not self.translatable:
+            raise PredicateNotTranslatable(
+                f'Rule cannot be translated. Got {repr(self.rule)}.')
+        consequence, alternative = [
+            None if result == DO_NOTHING else result
+            for result in [self.rule._logic.consequence, self.rule._logic.alternative]]
+        return Case(
+            When(self.q, then=Value(consequence)),
+            default=Value(alternative),
+            output_field=CharField())
+
+
+def annotate_rule_outcomes(queryset=None, rule_group=None, field_map=None):
+    """Returns a tuple of (queryset, untranslatable_rules) where the
+    queryset is annotated with the outcome of each translatable rule
+    using the rule name and untranslatable_rules is a list of rules
+    that must be evaluated with `Rule.run`.
+    """
+    annotations = {}
+    untranslatable_rules = []
+    for rule in rule_group.get_rules():
+        expression = RuleExpression(rule=rule, field_map=field_map)
+        if expression.translatable:
+            annotations.update({rule.name: expression.as_case()})
+        else:
+            untranslatable_rules.append(rule)
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset, untranslatable_rules
@@ -1,11 +1,14 @@
 import sys
 
+from collections import OrderedDict, namedtuple
 from django.apps import apps as django_apps
 from django.core.management.color import color_style
 from edc_reference.site import site_reference_configs
 
 style = color_style()
 
+MetadataUpdate = namedtuple('MetadataUpdate', 'target_model target_panel entry_status')
+
 
 class RuleGroup:
 
@@ -16,6 +19,40 @@ class RuleGroup:
     def get_rules(cls):
         return cls._meta.options.get('rules')
 
+    @classmethod
+    def evaluate_rules(cls, visit=None):
+        """Returns a tuple of (rule_results, metadata_objects) after
+        running the rules and updating metadata.
+        """
+        rule_results, metadata_updates = cls.get_metadata_updates(visit=visit)
+        metadata_objects = cls.update_metadata(
+            visit=visit, metadata_updates=metadata_updates)
+        return rule_results, metadata_objects
+
+    @classmethod
+    def get_metadata_updates(cls, visit=None):
+        """Returns a tuple of (rule_results, metadata_updates) where
+        metadata_updates is a list of MetadataUpdate.
+
+        Does not change metadata.
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def update_metadata(cls, visit=None, metadata_updates=None):
+        """Returns an ordered dictionary of metadata objects after
+        applying each MetadataUpdate in order.
+        """
+        metadata_objects = OrderedDict()
+        for target_model, target_panel, entry_status in metadata_updates:
+            opts = dict(visit=visit, target_model=target_model)
+            if target_panel:
+                opts.update(target_panel=target_panel)
+            metadata_updater = cls.metadata_updater_cls(**opts)
+            metadata_obj = metadata_updater.update(entry_status=entry_status)
+            metadata_objects.update({target_panel or target_model: metadata_obj})
+        return metadata_objects
+
     @classmethod
     def validate(cls):
         """Outputs to the console if a target model referenced in a rule
@@ -48,7 +48,44 @@ class RuleGroupMetaOptions:
             except AssertionError:
                 self.source_model = f'{self.app_label}.{self.source_model}'
             self.options.update(source_model=self.source_model)
+        # visit schedule scope, if any
+        self.set_scope(group_name)
+
+    def set_scope(self, group_name=None):
+        """Sets the visit schedule, schedule and visit codes the
+        rule group is scoped to, if any, or raises.
+        """
+        self.visit_schedule_name = self.options.get('visit_schedule_name')
+        self.schedule_name = self.options.get('schedule_name')
+        self.visit_codes = self.options.get('visit_codes')
+        if self.visit_codes is not None:
+            if isinstance(self.visit_codes, str):
+                raise RuleGroupMetaError(
+                    f'Invalid visit_codes. Expected a list or tuple. '
+                    f'Got \'{self.visit_codes}\'. See {group_name}.')
+            self.visit_codes = tuple(self.visit_codes)
+            self.options.update(visit_codes=self.visit_codes)
+        if self.schedule_name and not self.visit_schedule_name:
+            raise RuleGroupMetaError(
+                f'Expected visit_schedule_name if schedule_name is declared. '
+                f'See {group_name}.')
 
     @property
     def default_meta_options(self):
-        return ['app_label', 'source_model']
+        return ['app_label', 'source_model', 'visit_schedule_name',
+                'schedule_name', 'visit_codes']
+
+    def in_scope(self, visit_schedule_name=None, schedule_name=None, visit_code=None):
+        """Returns True if the rule group applies to a visit with the
+        given visit schedule, schedule and visit code.
+
+        A rule group without visit_schedule_name, schedule_name or
+        visit_codes applies to all visits.
+        """
+        if self.visit_schedule_name and self.visit_schedule_name != visit_schedule_name:
+            return False
+        if self.schedule_name and self.schedule_name != schedule_name:
+            return False
+        if self.visit_codes is not None and visit_code not in self.visit_codes:
+            return False
+        return True
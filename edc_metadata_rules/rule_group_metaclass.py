@@ -1,6 +1,6 @@
-import copy
-import inspect
+from collections import OrderedDict
 
+from .predicate import intern_predicate
 from .rule import Rule
 from .rule_group_meta_options import RuleGroupMetaOptions
 
@@ -22,17 +22,17 @@ class RuleGroupMetaclass(type):
             abstract = False
         parents = [b for b in bases if isinstance(b, RuleGroupMetaclass)]
         if not parents or abstract:
-            # If this isn't a subclass, don't do anything special.
+            # If this isn't a subclass, don't do anything special
+            # other than keep a table of declared rules for subclasses.
+            attrs.update({'_rules_table': cls.__get_rules_table(parents, attrs)})
             return super().__new__(cls, name, bases, attrs)
 
         # get rules from abstract parents
         for parent in parents:
             try:
                 if parent.Meta.abstract:
-                    for rule in [member for member in inspect.getmembers(parent)
-                                 if isinstance(member[1], Rule)]:
-                        parent_rule = copy.deepcopy(rule)
-                        attrs.update({parent_rule[0]: parent_rule[1]})
+                    for rule_name, rule in parent._rules_table.items():
+                        attrs.update({rule_name: rule.clone()})
             except AttributeError:
                 pass
 
@@ -48,6 +48,19 @@ class RuleGroupMetaclass(type):
             {'name': f'{meta.app_label}.{name.lower()}'})
         return super().__new__(cls, name, bases, attrs)
 
+    @classmethod
+    def __get_rules_table(cls, parents, attrs):
+        """Returns an ordered dictionary of {name: rule} for rules
+        declared on the class and inherited from parents.
+        """
+        rules_table = OrderedDict()
+        for parent in parents:
+            rules_table.update(getattr(parent, '_rules_table', {}))
+        rules_table.update(
+            {k: v for k, v in attrs.items()
+             if not k.startswith('_') and isinstance(v, Rule)})
+        return rules_table
+
     @classmethod
     def __get_rules(cls, name, attrs, meta):
         """Returns a list of rules after updating each rule's attrs
@@ -59,12 +72,20 @@ class RuleGroupMetaclass(type):
         for key, value in attrs.items():
             if not key.startswith('_'):
                 if isinstance(value, Rule):
-                    rule = value
+                    # a rule instance declared on more than one group
+                    # is already frozen by the first group.
+                    rule = value.clone() if value._frozen else value
+                    attrs.update({key: rule})
                     rule.name = key
                     rule.group = name
                     for k, v in meta.options.items():
                         setattr(rule, k, v)
                     rule.target_models = cls.__get_target_models(rule, meta)
+                    # share one instance of structurally equal predicates
+                    predicate = intern_predicate(rule._logic.predicate)
+                    if predicate is not rule._logic.predicate:
+                        rule._logic.predicate = predicate
+                    rule.freeze()
                     rules.append(rule)
         return tuple(rules)
 
@@ -0,0 +1,28 @@
+from django.apps import apps as django_apps
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .subject_rule_cache import subject_rule_cache
+
+
+def is_registered_subject_model(model_cls=None):
+    return model_cls is django_apps.get_app_config('edc_registration').model
+
+
+@receiver(post_save, weak=False,
+          dispatch_uid='subject_rule_cache_on_post_save')
+def subject_rule_cache_on_post_save(sender, instance, raw, **kwargs):
+    """Invalidates cached rule outcomes for the subject if the
+    registered subject is saved.
+    """
+    if not raw and is_registered_subject_model(sender):
+        subject_rule_cache.invalidate(
+            subject_identifier=instance.subject_identifier)
+
+
+@receiver(post_delete, weak=False,
+          dispatch_uid='subject_rule_cache_on_post_delete')
+def subject_rule_cache_on_post_delete(sender, instance, **kwargs):
+    if is_registered_subject_model(sender):
+        subject_rule_cache.invalidate(
+            subject_identifier=instance.subject_identifier)
@@ -1,10 +1,16 @@
-import copy
+import importlib
 import sys
+import threading
 
 from collections import OrderedDict
+from contextlib import contextmanager
 from django.apps import apps as django_apps
 from django.utils.module_loading import import_module, module_has_submodule
 
+from .attribute_sources import attribute_sources
+from .registry_snapshot import RegistrySnapshot
+from .subject_rule_cache import subject_rule_cache
+
 
 class SiteMetadataRulesAlreadyRegistered(Exception):
     pass
@@ -14,17 +20,85 @@ class SiteMetadataNoRulesError(Exception):
     pass
 
 
+class SiteMetadataRulesNotRegistered(Exception):
+    pass
+
+
 class SiteMetadataRules:
 
     """ Main controller of :class:`MetadataRules` objects.
+
+    Evaluation reads from `snapshot`, a read-only copy of the
+    registry that is replaced, not changed, when a rule group is
+    registered, replaced or unregistered. Evaluations already
+    running keep the snapshot they started with.
+
+    A rules module may be reloaded at runtime, see `reload`.
+
+    During `autodiscover` the snapshot is published once, after all
+    rules modules are imported, see `loading`.
     """
 
+    registry_snapshot_cls = RegistrySnapshot
+
     def __init__(self):
-        self.registry = OrderedDict()
+        self._lock = threading.RLock()
+        self._registry = OrderedDict()
+        self._groups_by_name = {}
+        self._reloading = None
+        self._loading = False
+        self.snapshot = self.registry_snapshot_cls()
 
-    def register(self, rule_group_cls=None):
+    @property
+    def registry(self):
+        return self._registry
+
+    @registry.setter
+    def registry(self, registry):
+        with self._lock:
+            self._registry = registry
+            self._groups_by_name = {
+                rule_group.name: rule_group
+                for rule_groups in registry.values() for rule_group in rule_groups}
+            self.refresh()
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def refresh(self):
+        """Publishes a new snapshot of the registry.
+
+        Not published while a module is being reloaded or while
+        rules modules are loading.
+        """
+        with self._lock:
+            if self._reloading is None and not self._loading:
+                self.snapshot = self.registry_snapshot_cls(
+                    registry=self._registry,
+                    version=self.snapshot.version + 1)
+
+    @contextmanager
+    def loading(self):
+        """Defers publishing a snapshot until the block exits, then
+        publishes one snapshot for all rule groups registered in the
+        block.
+        """
+        with self._lock:
+            loading, self._loading = self._loading, True
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._loading = loading
+                self.refresh()
+
+    def register(self, rule_group_cls=None, replace=None):
         """ Register MetadataRules to a list per app_label
         for the module the rule groups were declared in.
+
+        If `replace` is True, a rule group already registered with
+        the same name is replaced in place.
         """
         if rule_group_cls:
             if not rule_group_cls._meta.options.get('rules'):
@@ -32,21 +106,99 @@ class SiteMetadataRules:
                     f'The metadata rule group {rule_group_cls.name} '
                     f'has no rule!')
 
-            if rule_group_cls._meta.app_label not in self.registry:
-                self.registry.update({rule_group_cls._meta.app_label: []})
+            with self._lock:
+                if rule_group_cls._meta.app_label not in self.registry:
+                    self.registry.update({rule_group_cls._meta.app_label: []})
+                rule_groups = self.registry.get(rule_group_cls._meta.app_label)
+                registered = self._groups_by_name.get(rule_group_cls.name)
+                if registered:
+                    if not replace and (self._reloading is None
+                                        or registered.__module__ != self._reloading):
+                        raise SiteMetadataRulesAlreadyRegistered(
+                            f'The metadata rule group {rule_group_cls.name} '
+                            f'is already registered')
+                    rule_groups[rule_groups.index(registered)] = rule_group_cls
+                    self._discard_cached(registered)
+                else:
+                    rule_groups.append(rule_group_cls)
+                self._groups_by_name.update({rule_group_cls.name: rule_group_cls})
+                self.refresh()
 
-            for rgroup in self.registry.get(rule_group_cls._meta.app_label):
-                if rgroup.name == rule_group_cls.name:
-                    raise SiteMetadataRulesAlreadyRegistered(
-                        f'The metadata rule group {rule_group_cls.name} '
-                        f'is already registered')
-            self.registry.get(rule_group_cls._meta.app_label).append(
-                rule_group_cls)
+    def unregister(self, name=None):
+        """Unregisters a rule group by name, e.g.
+        'edc_metadata_rules.crfrulegroupone'.
+        """
+        with self._lock:
+            try:
+                rule_group = self._groups_by_name.pop(name)
+            except KeyError:
+                raise SiteMetadataRulesNotRegistered(
+                    f'The metadata rule group {name} is not registered')
+            self.registry.get(rule_group._meta.app_label).remove(rule_group)
+            self._discard_cached(rule_group)
+            self.refresh()
+
+    def _discard_cached(self, rule_group=None):
+        """Drops cached sources and outcomes of the rules of a rule
+        group that is replaced or unregistered.
+        """
+        rules = rule_group.get_rules()
+        attribute_sources.discard_rules(rules=rules)
+        subject_rule_cache.discard_rules(rules=rules)
+
+    def get_rule_group(self, name=None):
+        """Returns a registered rule group by name or raises.
+        """
+        try:
+            return self._groups_by_name[name]
+        except KeyError:
+            raise SiteMetadataRulesNotRegistered(
+                f'The metadata rule group {name} is not registered')
+
+    def reload(self, module=None):
+        """Reloads a rules module, given as a module or module name,
+        and publishes one new snapshot.
+
+        Rule groups re-declared in the module replace the registered
+        rule groups in place. Rule groups no longer declared are
+        unregistered. If the module fails to import, the registry is
+        left unchanged.
+        """
+        if isinstance(module, str):
+            module = import_module(module)
+        with self._lock:
+            registry = OrderedDict((k, list(v)) for k, v in self._registry.items())
+            previous = [rule_group for rule_group in self._groups_by_name.values()
+                        if rule_group.__module__ == module.__name__]
+            self._reloading = module.__name__
+            try:
+                module = importlib.reload(module)
+            except Exception:
+                # restored without publishing a snapshot
+                self.registry = registry
+                self._reloading = None
+                raise
+            self._reloading = None
+            for rule_group in previous:
+                if self._groups_by_name.get(rule_group.name) is rule_group:
+                    self._groups_by_name.pop(rule_group.name)
+                    self.registry.get(rule_group._meta.app_label).remove(rule_group)
+            attribute_sources.clear()
+            subject_rule_cache.invalidate()
+            self.refresh()
+        return self.snapshot
 
     @property
     def rule_groups(self):
         return self.registry
 
+    def rules_for_target(self, target_model=None, target_panel=None):
+        """Returns a tuple of RuleReference for rules that update
+        metadata for the target model or requisition panel.
+        """
+        return self.snapshot.rules_for_target(
+            target_model=target_model, target_panel=target_panel)
+
     def validate(self):
         for rule_groups in self.registry.values():
             for rule_group in rule_groups:
@@ -59,24 +211,27 @@ class SiteMetadataRules:
         """
         module_name = module_name or 'metadata_rules'
         sys.stdout.write(f' * checking for {module_name} ...\n')
-        for app in django_apps.app_configs:
-            try:
-                mod = import_module(app)
-                try:
-                    before_import_registry = copy.copy(
-                        site_metadata_rules.registry)
-                    import_module(f'{app}.{module_name}')
-                except Exception as e:
-                    if f'No module named \'{app}.{module_name}\'' not in str(e):
-                        site_metadata_rules.registry = before_import_registry
-                        if module_has_submodule(mod, module_name):
-                            raise
+        with self.loading():
+            for app in django_apps.app_configs:
+                self._import_rules_module(app=app, module_name=module_name)
 
-                else:
-                    sys.stdout.write(
-                        f'   - imported metadata rules from \'{app}.{module_name}\'\n')
-            except ImportError as e:
-                pass
+    def _import_rules_module(self, app=None, module_name=None):
+        try:
+            mod = import_module(app)
+            try:
+                before_import_registry = OrderedDict(
+                    (k, list(v)) for k, v in site_metadata_rules.registry.items())
+                import_module(f'{app}.{module_name}')
+            except Exception as e:
+                if f'No module named \'{app}.{module_name}\'' not in str(e):
+                    site_metadata_rules.registry = before_import_registry
+                    if module_has_submodule(mod, module_name):
+                        raise
+            else:
+                sys.stdout.write(
+                    f'   - imported metadata rules from \'{app}.{module_name}\'\n')
+        except ImportError:
+            pass
 
 
 site_metadata_rules = SiteMetadataRules()
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from django.apps import apps as django_apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+from .attribute_sources import attribute_sources, REGISTERED_SUBJECT
+from .evaluation_context import evaluation_context
+from .metadata_rule_evaluator import MetadataRuleEvaluator
+from .registry_snapshot import RuleReference
+from .rule_evaluator import RuleEvaluatorRegisterSubjectError
+from .site import site_metadata_rules
+from .subject_rule_cache import subject_rule_cache
+
+
+class SubjectMetadataRuleEvaluator:
+
+    """A class to evaluate rules for all visits of one subject, in
+    chronological order, in one evaluation context.
+
+    The registered subject, reference values and refsets used by
+    `PredicateCollection` are loaded once and shared by all visits.
+
+    For example, after correcting the gender of a registered subject:
+
+        SubjectMetadataRuleEvaluator(
+            subject_identifier='12345').refresh_registered_subject_rules()
+    """
+
+    metadata_rule_evaluator_cls = MetadataRuleEvaluator
+
+    def __init__(self, subject_identifier=None, app_label=None):
+        self.subject_identifier = subject_identifier
+        self.app_label = app_label
+        self._registered_subject = None
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'subject_identifier=\'{self.subject_identifier}\')')
+
+    @property
+    def registered_subject(self):
+        if not self._registered_subject:
+            model_cls = django_apps.get_app_config('edc_registration').model
+            try:
+                self._registered_subject = model_cls.objects.get(
+                    subject_identifier=self.subject_identifier)
+            except ObjectDoesNotExist as e:
+                raise RuleEvaluatorRegisterSubjectError(
+                    f'Registered subject required. See {repr(self)}. Got {e}.')
+        return self._registered_subject
+
+    @property
+    def visits(self):
+        """Returns a list of the subject's visits, for all visit
+        models, ordered by report_datetime.
+        """
+        visits = []
+        app_config = django_apps.get_app_config('edc_visit_tracking')
+        visit_models = set(
+            visit_model for app_label, (_, visit_model) in app_config.visit_models.items()
+            if not self.app_label or app_label == self.app_label)
+        for visit_model in sorted(visit_models):
+            model_cls = django_apps.get_model(visit_model)
+            visits.extend(model_cls.objects.filter(
+                subject_identifier=self.subject_identifier))
+        return sorted(visits, key=lambda visit: visit.report_datetime)
+
+    def evaluate_rules(self):
+        """Evaluates all rule groups for each visit, in order of
+        report_datetime, in one transaction.
+
+        The metadata updates of each visit are applied together, see
+        `MetadataRuleEvaluator.apply_rule_metadata_updates`.
+
+        Returns an ordered dictionary of {visit: [(rule_results,
+        metadata_objects), ...]}.
+        """
+        subject_rule_cache.invalidate(subject_identifier=self.subject_identifier)
+        results = OrderedDict()
+        with transaction.atomic():
+            with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+                context.registered_subjects.update(
+                    {self.subject_identifier: self.registered_subject})
+                for visit in self.visits:
+                    metadata_rule_evaluator = self.metadata_rule_evaluator_cls(visit=visit)
+                    rule_group_results = [
+                        (rule_group, rule_group.get_metadata_updates(visit=visit))
+                        for rule_group in metadata_rule_evaluator.get_rule_groups(
+                            snapshot=context.snapshot)]
+                    metadata_objects = metadata_rule_evaluator.apply_rule_metadata_updates([
+                        (rule_group, metadata_update)
+                        for rule_group, (_, metadata_updates) in rule_group_results
+                        for metadata_update in metadata_updates])
+                    results[visit] = []
+                    for _, (rule_results, metadata_updates) in rule_group_results:
+                        keys = [metadata_rule_evaluator.get_metadata_key(metadata_update)
+                                for metadata_update in metadata_updates]
+                        results[visit].append((rule_results, OrderedDict(
+                            [(key, metadata_objects.get(key)) for key in keys])))
+        return results
+
+    def refresh_registered_subject_rules(self):
+        """Re-evaluates only the rules that read a registered subject
+        attr, for each visit, and applies the metadata updates in one
+        transaction.
+
+        Returns an ordered dictionary of {visit: metadata_objects}.
+        """
+        subject_rule_cache.invalidate(subject_identifier=self.subject_identifier)
+        evaluations = []
+        with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+            context.registered_subjects.update(
+                {self.subject_identifier: self.registered_subject})
+            for visit in self.visits:
+                metadata_rule_evaluator = self.metadata_rule_evaluator_cls(visit=visit)
+                metadata_updates = []
+                for rule_group in metadata_rule_evaluator.get_rule_groups(
+                        snapshot=context.snapshot):
+                    for rule in rule_group.get_rules():
+                        sources = attribute_sources.get_rule_sources(
+                            rule=rule,
+                            visit_model_cls=visit.__class__,
+                            registered_subject_model_cls=self.registered_subject.__class__)
+                        if sources and REGISTERED_SUBJECT in sources:
+                            rule_reference = RuleReference(
+                                rule, rule_group, rule.source_model,
+                                tuple(rule.field_names))
+                            metadata_updates.extend(
+                                metadata_rule_evaluator.get_rule_metadata_updates(
+                                    rule_reference=rule_reference))
+                evaluations.append((metadata_rule_evaluator, metadata_updates))
+        results = OrderedDict()
+        with transaction.atomic():
+            for metadata_rule_evaluator, metadata_updates in evaluations:
+                results.update({
+                    metadata_rule_evaluator.visit:
+                    metadata_rule_evaluator.apply_rule_metadata_updates(metadata_updates)})
+        return results
@@ -0,0 +1,72 @@
+import threading
+
+from collections import OrderedDict
+
+from .attribute_sources import attribute_sources, REGISTERED_SUBJECT
+
+
+class SubjectRuleCache:
+
+    """A class to cache the outcome of rules that only read values
+    from the registered subject, per subject_identifier.
+
+    The cache is checked before the registered subject is fetched,
+    so a hit does not query the database. Entries are dropped when
+    the registered subject is saved or deleted (see signals) or when
+    the subject's metadata is refreshed. A registered subject
+    changed without a signal, e.g. with `update()` or by another
+    process, is not seen until then.
+    """
+
+    maxsize = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def is_subject_scoped(self, rule=None, visit=None, registered_subject_model_cls=None):
+        """Returns True if the rule only reads registered subject
+        attrs.
+        """
+        sources = attribute_sources.get_rule_sources(
+            rule=rule,
+            visit_model_cls=visit.__class__,
+            registered_subject_model_cls=registered_subject_model_cls)
+        return sources == frozenset([REGISTERED_SUBJECT])
+
+    def get_result(self, rule=None, subject_identifier=None, evaluate=None):
+        """Returns the cached outcome for the rule or calls `evaluate`
+        and caches the outcome.
+        """
+        with self._lock:
+            results = self._cache.get(subject_identifier)
+            if results is not None and rule in results:
+                self._cache.move_to_end(subject_identifier)
+                return results[rule]
+        result = evaluate()
+        with self._lock:
+            self._cache.setdefault(subject_identifier, {})[rule] = result
+            self._cache.move_to_end(subject_identifier)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return result
+
+    def discard_rules(self, rules=None):
+        """Drops cached outcomes of the given rules for all subjects.
+        """
+        with self._lock:
+            for rule in rules or []:
+                for results in self._cache.values():
+                    results.pop(rule, None)
+
+    def invalidate(self, subject_identifier=None):
+        """Drops cached outcomes for the subject or for all subjects.
+        """
+        with self._lock:
+            if subject_identifier:
+                self._cache.pop(subject_identifier, None)
+            else:
+                self._cache.clear()
+
+
+subject_rule_cache = SubjectRuleCache()
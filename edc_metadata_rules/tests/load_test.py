@@ -0,0 +1,294 @@
+import math
+import multiprocessing
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from django.db import DatabaseError, connections, transaction
+from edc_constants.constants import MALE, YES, NO
+from edc_metadata import NOT_REQUIRED, REQUIRED
+from edc_visit_tracking.constants import SCHEDULED
+
+from ..crf import CrfRule, CrfRuleGroup
+from ..deferred_evaluation import deferred_evaluations, deferred_rule_evaluation
+from ..predicate import P
+from ..requisition import RequisitionRule, RequisitionRuleGroup
+from ..site import SiteMetadataRulesNotRegistered, site_metadata_rules
+from ..throttle import Throttle
+
+Sample = namedtuple('Sample', 'evaluation lock_wait write total error')
+
+DEADLOCK = 'deadlock'
+LOCK_TIMEOUT = 'lock_timeout'
+ERROR = 'error'
+
+
+class LoadTestPanel:
+
+    def __init__(self, name):
+        self.name = name
+
+
+class LoadTestCrfOneRuleGroup(CrfRuleGroup):
+
+    car = CrfRule(
+        predicate=P('f1', 'eq', 'car'),
+        consequence=REQUIRED,
+        alternative=NOT_REQUIRED,
+        target_models=['crffour', 'crffive'])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+
+
+class LoadTestCrfTwoRuleGroup(CrfRuleGroup):
+
+    car = CrfRule(
+        predicate=P('f1', 'eq', 'car'),
+        consequence=REQUIRED,
+        alternative=NOT_REQUIRED,
+        target_models=['crffive', 'crffour', 'crfthree'])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crftwo'
+
+
+class LoadTestRequisitionRuleGroup(RequisitionRuleGroup):
+
+    car = RequisitionRule(
+        predicate=P('f1', 'eq', 'car'),
+        consequence=REQUIRED,
+        alternative=NOT_REQUIRED,
+        target_panels=[LoadTestPanel('two'), LoadTestPanel('one')])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+        requisition_model = 'subjectrequisition'
+
+
+rule_groups = [
+    LoadTestCrfOneRuleGroup, LoadTestCrfTwoRuleGroup, LoadTestRequisitionRuleGroup]
+
+
+def percentile(values=None, p=None):
+    """Returns the nearest-rank percentile of values or None.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def get_error(e=None):
+    message = str(e).lower()
+    if getattr(getattr(e, '__cause__', None), 'pgcode', None) == '40P01' or (
+            'deadlock' in message):
+        return DEADLOCK
+    elif 'lock' in message:
+        return LOCK_TIMEOUT
+    return ERROR
+
+
+class LoadTest:
+
+    """A class to save CRFs and requisitions of the test models for
+    the same visits from concurrent threads or processes and time
+    rule evaluation and metadata writes.
+
+    Rules are evaluated as when the CRF is saved, see
+    `deferred_rule_evaluation`, but in three timed steps; evaluation
+    (`MetadataRuleEvaluator.get_metadata_updates`), the wait to lock
+    the visit's metadata rows with `select_for_update` and the
+    metadata writes, all in one transaction. If `unordered`, writes
+    are applied in rule declaration order, as before
+    `apply_rule_metadata_updates` sorted them, for comparison.
+
+    For use with a local database and the test settings only; it
+    creates subjects and registers its rule groups, replacing any
+    registered with the same name until `teardown`.
+    """
+
+    def __init__(self, subjects=None, saves=None, rate=None, unordered=None):
+        self.subjects = subjects or 2
+        self.saves = saves or 50
+        self.rate = rate
+        self.unordered = unordered
+        self.forms = []
+        self.replaced = {}
+
+    def setup(self):
+        """Registers the load test rule groups and creates subjects,
+        each with a visit, CRFs and a requisition.
+
+        Sets self.forms to a list of (model_cls, pk) per visit.
+        """
+        from edc_appointment.models import Appointment
+        from edc_facility.import_holidays import import_holidays
+        from edc_lab.models.panel import Panel
+        from edc_reference.site import site_reference_configs
+        from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+        from faker import Faker
+        from .models import CrfOne, CrfTwo, SubjectConsent
+        from .models import SubjectRequisition, SubjectVisit
+        from .reference_configs import register_to_site_reference_configs
+        from .visit_schedule import visit_schedule
+
+        import_holidays()
+        if visit_schedule.name not in site_visit_schedules._registry:
+            site_visit_schedules.register(visit_schedule)
+        register_to_site_reference_configs()
+        site_reference_configs.register_from_visit_schedule(
+            visit_models={
+                'edc_appointment.appointment': 'edc_metadata_rules.subjectvisit'})
+        for rule_group_cls in rule_groups:
+            try:
+                self.replaced[rule_group_cls.name] = site_metadata_rules.get_rule_group(
+                    rule_group_cls.name)
+            except SiteMetadataRulesNotRegistered:
+                self.replaced[rule_group_cls.name] = None
+            site_metadata_rules.register(rule_group_cls=rule_group_cls, replace=True)
+        _, schedule = site_visit_schedules.get_by_onschedule_model(
+            'edc_metadata_rules.onschedule')
+        panel, _ = Panel.objects.get_or_create(name='five')
+        fake = Faker()
+        self.forms = []
+        for _ in range(self.subjects):
+            subject_consent = SubjectConsent.objects.create(
+                subject_identifier=fake.credit_card_number(), gender=MALE)
+            schedule.put_on_schedule(
+                subject_identifier=subject_consent.subject_identifier,
+                onschedule_datetime=subject_consent.consent_datetime)
+            appointment = Appointment.objects.get(
+                subject_identifier=subject_consent.subject_identifier,
+                visit_code=schedule.visits.first.code)
+            subject_visit = SubjectVisit.objects.create(
+                appointment=appointment, reason=SCHEDULED,
+                subject_identifier=subject_consent.subject_identifier)
+            self.forms.append([
+                (CrfOne, CrfOne.objects.create(subject_visit=subject_visit).pk),
+                (CrfTwo, CrfTwo.objects.create(subject_visit=subject_visit).pk),
+                (SubjectRequisition, SubjectRequisition.objects.create(
+                    subject_visit=subject_visit, panel=panel, is_drawn=YES).pk)])
+
+    def teardown(self):
+        """Unregisters the load test rule groups and re-registers
+        any rule group they replaced.
+        """
+        for name, rule_group_cls in self.replaced.items():
+            if rule_group_cls:
+                site_metadata_rules.register(rule_group_cls=rule_group_cls, replace=True)
+            else:
+                site_metadata_rules.unregister(name)
+        self.replaced = {}
+
+    def run(self, workers=None, processes=None):
+        """Returns a dictionary of results after running `workers`
+        concurrent workers, see `summarize`.
+        """
+        if processes:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                samples = pool.map(self.work, range(workers))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                samples = list(executor.map(self.work, range(workers)))
+        return self.summarize([sample for worker in samples for sample in worker])
+
+    def work(self, worker=None):
+        """Returns a list of Sample for one worker.
+
+        Each worker saves the forms of all visits in turn, starting
+        with another form than the other workers.
+        """
+        samples = []
+        throttle = Throttle(max_rate=self.rate)
+        try:
+            for chunk in throttle.chunks(range(self.saves), chunk_size=1):
+                for n in chunk:
+                    visit_forms = self.forms[n % len(self.forms)]
+                    model_cls, pk = visit_forms[(worker + n) % len(visit_forms)]
+                    value = n // len(self.forms) % 2 == 0
+                    samples.append(self.save(model_cls, pk, value))
+        finally:
+            connections.close_all()
+        return samples
+
+    def save(self, model_cls=None, pk=None, value=None):
+        """Returns a Sample after saving the form and evaluating its
+        visit's rules in one transaction.
+        """
+        evaluation = lock_wait = write = None
+        start = time.monotonic()
+        try:
+            with transaction.atomic():
+                obj = model_cls.objects.get(pk=pk)
+                if hasattr(obj, 'is_drawn'):
+                    obj.is_drawn = YES if value else NO
+                else:
+                    obj.f1 = 'car' if value else 'bicycle'
+                with deferred_rule_evaluation():
+                    obj.save()
+                while deferred_evaluations.pending:
+                    _, metadata_rule_evaluator = deferred_evaluations.pending.popitem(
+                        last=False)
+                    started = time.monotonic()
+                    metadata_updates = metadata_rule_evaluator.get_metadata_updates()
+                    evaluated = time.monotonic()
+                    self.lock(metadata_rule_evaluator.visit)
+                    locked = time.monotonic()
+                    self.apply(metadata_rule_evaluator, metadata_updates)
+                    evaluation = (evaluation or 0) + evaluated - started
+                    lock_wait = (lock_wait or 0) + locked - evaluated
+                    write = (write or 0) + time.monotonic() - locked
+        except DatabaseError as e:
+            deferred_evaluations.pending.clear()
+            return Sample(
+                evaluation, lock_wait, write, time.monotonic() - start, get_error(e))
+        return Sample(evaluation, lock_wait, write, time.monotonic() - start, None)
+
+    @staticmethod
+    def lock(visit=None):
+        """Locks the visit's metadata rows, in primary key order,
+        until the transaction ends.
+
+        The writes would wait for the same locks, so this separates
+        the time spent waiting from the time spent writing. A no-op
+        on databases without `select_for_update`, e.g. sqlite.
+        """
+        from edc_metadata.models import CrfMetadata, RequisitionMetadata
+
+        for model_cls in [CrfMetadata, RequisitionMetadata]:
+            list(model_cls.objects.select_for_update().filter(
+                subject_identifier=visit.subject_identifier,
+                visit_code=visit.visit_code).order_by('pk').values_list('pk'))
+
+    def apply(self, metadata_rule_evaluator=None, metadata_updates=None):
+        if not self.unordered:
+            metadata_rule_evaluator.apply_rule_metadata_updates(metadata_updates)
+        else:
+            with transaction.atomic():
+                for rule_group, metadata_update in metadata_updates:
+                    rule_group.update_metadata(
+                        visit=metadata_rule_evaluator.visit,
+                        metadata_updates=[metadata_update])
+
+    @staticmethod
+    def summarize(samples=None):
+        """Returns a dictionary of counts and p50, p95 and p99 in
+        milliseconds of evaluation, lock wait, write and total save
+        times.
+        """
+        summary = dict(
+            saves=len(samples),
+            deadlocks=len([s for s in samples if s.error == DEADLOCK]),
+            lock_timeouts=len([s for s in samples if s.error == LOCK_TIMEOUT]),
+            errors=len([s for s in samples if s.error == ERROR]))
+        for name in ['evaluation', 'lock_wait', 'write', 'total']:
+            values = [getattr(s, name) * 1000 for s in samples
+                      if getattr(s, name) is not None and not s.error]
+            for p in [50, 95, 99]:
+                summary[f'{name}_p{p}'] = percentile(values, p)
+        return summary
@@ -19,6 +19,8 @@ from edc_metadata.model_mixins.updates import UpdatesCrfMetadataModelMixin
 from edc_metadata.model_mixins.updates import UpdatesRequisitionMetadataModelMixin
 from edc_lab.models.model_mixins.panel_model_mixin import PanelModelMixin
 
+from ..model_mixins import MetadataRulesChangedFieldsModelMixin, MetadataRulesModelMixin
+
 
 class OnSchedule(OnScheduleModelMixin, BaseUuidModel):
 
@@ -77,7 +79,7 @@ class SubjectVisit(VisitModelMixin, ReferenceModelMixin,
 
 
 class SubjectRequisition(CrfModelMixin, RequisitionReferenceModelMixin,
-                         PanelModelMixin,
+                         PanelModelMixin, MetadataRulesModelMixin,
                          UpdatesRequisitionMetadataModelMixin,
                          BaseUuidModel):
 
@@ -118,13 +120,16 @@ class CrfThree(CrfModelMixin, ReferenceModelMixin, UpdatesCrfMetadataModelMixin,
     f1 = models.CharField(max_length=50, null=True)
 
 
-class CrfFour(CrfModelMixin, ReferenceModelMixin, UpdatesCrfMetadataModelMixin,
-              BaseUuidModel):
+class CrfFour(CrfModelMixin, ReferenceModelMixin,
+              MetadataRulesChangedFieldsModelMixin,
+              UpdatesCrfMetadataModelMixin, BaseUuidModel):
 
     subject_visit = models.ForeignKey(SubjectVisit, on_delete=PROTECT)
 
     f1 = models.CharField(max_length=50, null=True)
 
+    f2 = models.CharField(max_length=50, null=True)
+
 
 class CrfFive(CrfModelMixin, ReferenceModelMixin, UpdatesCrfMetadataModelMixin,
               BaseUuidModel):
@@ -30,7 +30,7 @@ def register_to_site_reference_configs():
 
     reference = ReferenceModelConfig(
         name='edc_metadata_rules.CrfFour',
-        fields=['f1'])
+        fields=['f1', 'f2'])
     site_reference_configs.register(reference)
 
     reference = ReferenceModelConfig(
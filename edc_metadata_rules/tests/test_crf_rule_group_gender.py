@@ -1,5 +1,7 @@
 from collections import OrderedDict
+from django.db import connection
 from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
 from edc_base import get_utcnow
 from edc_constants.constants import MALE, FEMALE
 from edc_facility.import_holidays import import_holidays
@@ -14,9 +16,11 @@ from faker import Faker
 
 from ..crf import CrfRuleGroup, CrfRule, CrfRuleModelConflict
 from ..predicate import P, PF, PredicateError
+from ..metadata_rule_evaluator import MetadataRuleEvaluator
 from ..rule_evaluator import RuleEvaluatorRegisterSubjectError
 from ..rule_group_meta_options import RuleGroupMetaError
 from ..site import site_metadata_rules
+from ..subject_metadata_rule_evaluator import SubjectMetadataRuleEvaluator
 from .models import Appointment, SubjectVisit, SubjectConsent, CrfOne
 from .reference_configs import register_to_site_reference_configs
 from .visit_schedule import visit_schedule
@@ -301,6 +305,93 @@ class TestMetadataRulesWithGender(TestCase):
         self.assertEqual(rule_results['CrfRuleGroupGender.crfs_female'].get(
             'edc_metadata_rules.crfthree'), NOT_REQUIRED)
 
+    def test_subject_rule_cache_invalidated_on_registered_subject_save(self):
+        subject_visit = self.enroll(gender=MALE)
+        rule_results, _ = CrfRuleGroupGender().evaluate_rules(visit=subject_visit)
+        self.assertEqual(rule_results['CrfRuleGroupGender.crfs_male'].get(
+            'edc_metadata_rules.crffour'), REQUIRED)
+        registered_subject = RegisteredSubject.objects.get(
+            subject_identifier=subject_visit.subject_identifier)
+        registered_subject.gender = FEMALE
+        registered_subject.save()
+        rule_results, _ = CrfRuleGroupGender().evaluate_rules(visit=subject_visit)
+        self.assertEqual(rule_results['CrfRuleGroupGender.crfs_male'].get(
+            'edc_metadata_rules.crffour'), NOT_REQUIRED)
+        self.assertEqual(rule_results['CrfRuleGroupGender.crfs_female'].get(
+            'edc_metadata_rules.crftwo'), REQUIRED)
+
+    def test_subject_rule_cache_hit_does_not_query(self):
+        subject_visit = self.enroll(gender=MALE)
+        rule = [r for r in CrfRuleGroupGender.get_rules() if r.name == 'crfs_male'][0]
+        self.assertEqual(
+            list(rule.run(visit=subject_visit).values()), [REQUIRED, REQUIRED])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(rule.run(visit=subject_visit).values()), [REQUIRED, REQUIRED])
+
+    def test_replace_rule_group_discards_cached_outcomes(self):
+        subject_visit = self.enroll(gender=MALE)
+        rule_group = CrfRuleGroupGender
+        rule = [r for r in rule_group.get_rules() if r.name == 'crfs_male'][0]
+        rule.run(visit=subject_visit)
+
+        class CrfRuleGroupGender(CrfRuleGroup):
+
+            crfs_male = CrfRule(
+                predicate=P('gender', 'eq', MALE),
+                consequence=NOT_REQUIRED,
+                alternative=REQUIRED,
+                target_models=['crffour', 'crffive'])
+
+            class Meta:
+                app_label = 'edc_metadata_rules'
+
+        site_metadata_rules.register(CrfRuleGroupGender, replace=True)
+        self.assertIs(
+            site_metadata_rules.get_rule_group(rule_group.name), CrfRuleGroupGender)
+        MetadataRuleEvaluator(visit=subject_visit).evaluate_rules()
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crffour',
+            subject_identifier=subject_visit.subject_identifier).entry_status,
+            NOT_REQUIRED)
+        with CaptureQueriesContext(connection) as context:
+            rule.run(visit=subject_visit)
+        self.assertTrue(context.captured_queries)
+
+    def test_refresh_registered_subject_rules(self):
+        subject_visit = self.enroll(gender=MALE)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo',
+            subject_identifier=subject_visit.subject_identifier).entry_status,
+            NOT_REQUIRED)
+        RegisteredSubject.objects.filter(
+            subject_identifier=subject_visit.subject_identifier).update(gender=FEMALE)
+        results = SubjectMetadataRuleEvaluator(
+            subject_identifier=subject_visit.subject_identifier
+        ).refresh_registered_subject_rules()
+        self.assertEqual(list(results), [subject_visit])
+        for target_model, entry_status in [
+                ('edc_metadata_rules.crftwo', REQUIRED),
+                ('edc_metadata_rules.crfthree', REQUIRED),
+                ('edc_metadata_rules.crffour', NOT_REQUIRED),
+                ('edc_metadata_rules.crffive', NOT_REQUIRED)]:
+            with self.subTest(target_model=target_model):
+                self.assertEqual(CrfMetadata.objects.get(
+                    model=target_model,
+                    subject_identifier=subject_visit.subject_identifier).entry_status,
+                    entry_status)
+
+    def test_subject_evaluate_rules(self):
+        subject_visit = self.enroll(gender=FEMALE)
+        results = SubjectMetadataRuleEvaluator(
+            subject_identifier=subject_visit.subject_identifier).evaluate_rules()
+        self.assertEqual(list(results), [subject_visit])
+        (rule_results, _), = results[subject_visit]
+        self.assertEqual(rule_results['CrfRuleGroupGender.crfs_female'].get(
+            'edc_metadata_rules.crftwo'), REQUIRED)
+        self.assertEqual(rule_results['CrfRuleGroupGender.crfs_male'].get(
+            'edc_metadata_rules.crffour'), NOT_REQUIRED)
+
     def test_bad_rule_group_target_model_cannot_also_be_source_model(self):
 
         site_metadata_rules.registry = OrderedDict()
@@ -502,6 +593,41 @@ class TestMetadataRulesWithGender(TestCase):
 
         self.assertTrue(len(NewCrfRuleGroup()._meta.options.get('rules')), 2)
 
+    def test_sub_class_rule_group_inherits_rules_from_abstract(self):
+
+        class MyCrfRuleGroup(CrfRuleGroup):
+            rule1 = CrfRule(
+                predicate=P('f1', 'eq', 'car'),
+                consequence=REQUIRED,
+                alternative=NOT_REQUIRED,
+                target_models=['crftwo'])
+
+            class Meta:
+                abstract = True
+
+        predicate = MyCrfRuleGroup.rule1._logic.predicate
+
+        class NewCrfRuleGroup(MyCrfRuleGroup):
+
+            rule2 = CrfRule(
+                predicate=P('f1', 'eq', 'car'),
+                consequence=REQUIRED,
+                alternative=NOT_REQUIRED,
+                target_models=['crfthree'])
+
+            class Meta:
+                app_label = 'edc_metadata_rules'
+                source_model = 'edc_metadata_rules.crfmissingmanager'
+
+        rules = NewCrfRuleGroup._meta.options.get('rules')
+        self.assertEqual([rule.name for rule in rules], ['rule2', 'rule1'])
+        self.assertIsNot(rules[1], MyCrfRuleGroup.rule1)
+        self.assertEqual(rules[1].target_models, ['edc_metadata_rules.crftwo'])
+        self.assertEqual(MyCrfRuleGroup.rule1.target_models, ['crftwo'])
+        self.assertIsNone(MyCrfRuleGroup.rule1.name)
+        self.assertIsNot(rules[1]._logic, MyCrfRuleGroup.rule1._logic)
+        self.assertIs(MyCrfRuleGroup.rule1._logic.predicate, predicate)
+
     def test_rule_group_missing_meta(self):
 
         try:
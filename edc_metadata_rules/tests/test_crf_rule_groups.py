@@ -1,22 +1,33 @@
+import json
+import os
+import tempfile
+
 from collections import OrderedDict
 from faker import Faker
 from django.apps import apps as django_apps
-from django.test import TestCase, tag
+from django.db import DatabaseError, transaction
+from django.test import TestCase, TransactionTestCase, tag
 
 from edc_base import get_utcnow
-from edc_constants.constants import MALE
+from edc_constants.constants import FEMALE, MALE
 from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 from edc_visit_tracking.constants import SCHEDULED
 
-from edc_metadata import NOT_REQUIRED, REQUIRED, KEYED
+from edc_metadata import NOT_REQUIRED, REQUIRED, KEYED, DO_NOTHING
 from edc_metadata.models import CrfMetadata
 
-from ..crf import CrfRuleGroup, CrfRule
+from ..crf import CrfRuleGroup, CrfRule, CrfDecisionTableRule
+from ..data_snapshot import MmapSnapshot, MmapSnapshotWriter
+from ..data_snapshot import SnapshotRuleEvaluator, read_snapshot
+from ..deferred_evaluation import deferred_evaluations, deferred_rule_evaluation
+from ..evaluation_context import EvaluationContext, evaluation_context
+from ..metadata_rule_evaluator import MetadataRuleEvaluator
 from ..predicate import P
+from ..rule_group import MetadataUpdate
 from ..site import site_metadata_rules
 from .reference_configs import register_to_site_reference_configs
 from .models import Appointment, SubjectVisit
-from .models import CrfOne, CrfTwo, SubjectConsent
+from .models import CrfFour, CrfOne, CrfTwo, SubjectConsent
 from .visit_schedule import visit_schedule
 from edc_reference.site import site_reference_configs
 from edc_facility.import_holidays import import_holidays
@@ -63,7 +74,62 @@ class CrfRuleGroupTwo(CrfRuleGroup):
         source_model = 'edc_metadata_rules.crfone'
 
 
-class TestMetadataRules(TestCase):
+class CrfRuleGroupThree(CrfRuleGroup):
+
+    crfs_boat = CrfRule(
+        predicate=P('f1', 'eq', 'boat'),
+        consequence=REQUIRED,
+        alternative=NOT_REQUIRED,
+        target_models=['crfseven'])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+        visit_schedule_name = 'visit_schedule'
+        schedule_name = 'schedule'
+        visit_codes = ['2000', '3000']
+
+
+class CrfRuleGroupDecisionTable(CrfRuleGroup):
+
+    transport = CrfDecisionTableRule(
+        attr='f1',
+        rows=[('car', ['crftwo']),
+              ('bicycle', ['crfthree']),
+              ('truck', ['crftwo', 'crfthree'], NOT_REQUIRED, DO_NOTHING)])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+
+
+class CrfRuleGroupGenderDoNothing(CrfRuleGroup):
+
+    crfs_female = CrfRule(
+        predicate=P('gender', 'eq', FEMALE),
+        consequence=REQUIRED,
+        alternative=DO_NOTHING,
+        target_models=['crffour'])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+
+
+class CrfRuleGroupFour(CrfRuleGroup):
+
+    crfs_car = CrfRule(
+        predicate=P('f1', 'eq', 'car'),
+        consequence=REQUIRED,
+        alternative=NOT_REQUIRED,
+        target_models=['crfthree'])
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crffour'
+
+
+class MetadataRulesTestMixin:
 
     def setUp(self):
 
@@ -101,6 +167,9 @@ class TestMetadataRules(TestCase):
             subject_identifier=subject_identifier)
         return subject_visit
 
+
+class TestMetadataRules(MetadataRulesTestMixin, TestCase):
+
     def test_example1(self):
         """Asserts CrfTwo is REQUIRED if f1==\'car\' as specified.
         """
@@ -255,3 +324,384 @@ class TestMetadataRules(TestCase):
 
         self.assertEqual(CrfMetadata.objects.get(
             model='edc_metadata_rules.crftwo').entry_status, NOT_REQUIRED)
+
+    def test_deferred_evaluation_is_coalesced(self):
+        """Asserts deferred rules run once per visit and only when
+        the pending evaluation runs (on commit).
+        """
+        subject_visit = self.enroll(gender=MALE)
+        with deferred_rule_evaluation():
+            CrfOne.objects.create(subject_visit=subject_visit, f3='bicycle')
+            MetadataRuleEvaluator(visit=subject_visit).evaluate_rules()
+            MetadataRuleEvaluator(visit=subject_visit).evaluate_rules()
+
+        self.assertEqual(len(deferred_evaluations.pending), 1)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, REQUIRED)
+
+        for key in list(deferred_evaluations.pending):
+            deferred_evaluations.evaluate(key)
+
+        self.assertEqual(deferred_evaluations.pending, {})
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, NOT_REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, REQUIRED)
+
+    def test_rule_group_skipped_if_rule_fields_unchanged(self):
+        subject_visit = self.enroll(gender=MALE)
+        snapshot = site_metadata_rules.snapshot
+        evaluator = MetadataRuleEvaluator(
+            visit=subject_visit, source_model='edc_metadata_rules.crfone',
+            changed_fields=['f2'])
+        self.assertEqual(evaluator.get_rule_groups(snapshot=snapshot), [])
+        evaluator = MetadataRuleEvaluator(
+            visit=subject_visit, source_model='edc_metadata_rules.crfone',
+            changed_fields=['f3'])
+        self.assertEqual(
+            evaluator.get_rule_groups(snapshot=snapshot), [CrfRuleGroupOne])
+        evaluator = MetadataRuleEvaluator(visit=subject_visit)
+        self.assertEqual(
+            evaluator.get_rule_groups(snapshot=snapshot),
+            [CrfRuleGroupOne, CrfRuleGroupTwo])
+
+    def test_rules_for_target(self):
+        rule_references = site_metadata_rules.rules_for_target(
+            target_model='edc_metadata_rules.crftwo')
+        self.assertEqual(len(rule_references), 1)
+        rule_reference = rule_references[0]
+        self.assertEqual(rule_reference.rule.name, 'crfs_car')
+        self.assertEqual(rule_reference.rule_group, CrfRuleGroupOne)
+        self.assertEqual(rule_reference.source_model, 'edc_metadata_rules.crfone')
+        self.assertEqual(rule_reference.field_names, ('f1', ))
+        self.assertEqual(site_metadata_rules.rules_for_target(
+            target_model='edc_metadata_rules.crfseven'), ())
+
+    def test_evaluate_rules_for_target(self):
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        CrfMetadata.objects.filter(model='edc_metadata_rules.crftwo').update(
+            entry_status=NOT_REQUIRED)
+        metadata_obj = MetadataRuleEvaluator(
+            visit=subject_visit).evaluate_rules_for_target(
+                target_model='edc_metadata_rules.crftwo')
+        self.assertEqual(metadata_obj.entry_status, REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, REQUIRED)
+
+    def test_rule_metadata_updates_only_for_scheduled_targets(self):
+        subject_visit = self.enroll(gender=MALE)
+        appointment = Appointment.objects.get(
+            subject_identifier=subject_visit.subject_identifier, visit_code='2000')
+        subject_visit_two = SubjectVisit.objects.create(
+            appointment=appointment, reason=SCHEDULED,
+            subject_identifier=subject_visit.subject_identifier)
+        # crftwo is scheduled at 1000, not at 2000
+        rule_reference, = site_metadata_rules.rules_for_target(
+            target_model='edc_metadata_rules.crftwo')
+        self.assertEqual(
+            [metadata_update.target_model for _, metadata_update in
+             MetadataRuleEvaluator(visit=subject_visit).get_rule_metadata_updates(
+                 rule_reference=rule_reference)],
+            ['edc_metadata_rules.crftwo'])
+        self.assertEqual(
+            MetadataRuleEvaluator(visit=subject_visit_two).get_rule_metadata_updates(
+                rule_reference=rule_reference), [])
+        self.assertIsNone(MetadataRuleEvaluator(
+            visit=subject_visit_two).evaluate_rules_for_target(
+                target_model='edc_metadata_rules.crftwo'))
+        self.assertFalse(CrfMetadata.objects.filter(
+            model='edc_metadata_rules.crftwo', visit_code='2000').exists())
+        # crfsix is scheduled at 2000, not at 1000
+        self.assertIsNone(MetadataRuleEvaluator(
+            visit=subject_visit).evaluate_rules_for_target(
+                target_model='edc_metadata_rules.crfsix'))
+
+    def test_rules_for_deleted_source_model_have_no_value(self):
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        rule_references = site_metadata_rules.snapshot.rules_for_source(
+            'edc_metadata_rules.crfone')
+        self.assertEqual(
+            [str(r.rule) for r in rule_references],
+            ['CrfRuleGroupOne.crfs_car', 'CrfRuleGroupOne.crfs_bicycle',
+             'CrfRuleGroupTwo.crfs_truck', 'CrfRuleGroupTwo.crfs_train'])
+        self.assertEqual(
+            CrfRuleGroupOne.crfs_car.run(visit=subject_visit),
+            {'edc_metadata_rules.crftwo': REQUIRED})
+        with evaluation_context(snapshot=site_metadata_rules.snapshot) as context:
+            context.absent_source_models.add('edc_metadata_rules.crfone')
+            self.assertEqual(
+                CrfRuleGroupOne.crfs_car.run(visit=subject_visit),
+                {'edc_metadata_rules.crftwo': None})
+
+    def test_evaluate_rules_for_deleted_resets_targets_to_schedule(self):
+        subject_visit = self.enroll(gender=MALE)
+        crf_one = CrfOne.objects.create(subject_visit=subject_visit, f1='truck')
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, NOT_REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, NOT_REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crffive').entry_status, REQUIRED)
+        crf_one.delete()
+        MetadataRuleEvaluator(visit=subject_visit).evaluate_rules_for_deleted(
+            source_model='edc_metadata_rules.crfone')
+        # all are required=True in the visit schedule
+        for model in ['crftwo', 'crfthree', 'crffive']:
+            with self.subTest(model=model):
+                self.assertEqual(CrfMetadata.objects.get(
+                    model=f'edc_metadata_rules.{model}').entry_status, REQUIRED)
+
+    def test_evaluate_rules_for_deleted_keeps_do_nothing_targets(self):
+        site_metadata_rules.register(rule_group_cls=CrfRuleGroupGenderDoNothing)
+        subject_visit = self.enroll(gender=MALE)
+        crf_one = CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        CrfMetadata.objects.filter(model='edc_metadata_rules.crffour').update(
+            entry_status=NOT_REQUIRED)
+        crf_one.delete()
+        MetadataRuleEvaluator(visit=subject_visit).evaluate_rules_for_deleted(
+            source_model='edc_metadata_rules.crfone')
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, REQUIRED)
+        # crfs_female only reads the registered subject
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crffour').entry_status, NOT_REQUIRED)
+
+    def test_rule_group_skipped_if_visit_not_in_scope(self):
+        site_metadata_rules.register(rule_group_cls=CrfRuleGroupThree)
+        subject_visit = self.enroll(gender=MALE)
+        self.assertEqual(subject_visit.visit_code, '1000')
+        snapshot = site_metadata_rules.snapshot
+        evaluator = MetadataRuleEvaluator(visit=subject_visit)
+        self.assertEqual(
+            evaluator.get_rule_groups(snapshot=snapshot),
+            [CrfRuleGroupOne, CrfRuleGroupTwo])
+        self.assertTrue(CrfRuleGroupThree._meta.in_scope(
+            visit_schedule_name='visit_schedule', schedule_name='schedule',
+            visit_code='2000'))
+        self.assertFalse(CrfRuleGroupThree._meta.in_scope(
+            visit_schedule_name='visit_schedule', schedule_name='schedule',
+            visit_code='1000'))
+
+    def test_decision_table_rule(self):
+        subject_visit = self.enroll(gender=MALE)
+        rule = CrfRuleGroupDecisionTable.transport
+        self.assertEqual(rule.field_names, ['f1'])
+        self.assertEqual(
+            rule.run(visit=subject_visit),
+            {'edc_metadata_rules.crftwo': None,
+             'edc_metadata_rules.crfthree': None})
+        crf_one = CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        self.assertEqual(
+            rule.run(visit=subject_visit),
+            {'edc_metadata_rules.crftwo': REQUIRED,
+             'edc_metadata_rules.crfthree': NOT_REQUIRED})
+        crf_one.f1 = 'truck'
+        crf_one.save()
+        self.assertEqual(
+            rule.run(visit=subject_visit),
+            {'edc_metadata_rules.crftwo': NOT_REQUIRED,
+             'edc_metadata_rules.crfthree': NOT_REQUIRED})
+        crf_one.f1 = 'boat'
+        crf_one.save()
+        self.assertEqual(
+            rule.run(visit=subject_visit),
+            {'edc_metadata_rules.crftwo': NOT_REQUIRED,
+             'edc_metadata_rules.crfthree': NOT_REQUIRED})
+
+    def test_decision_table_rule_from_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), 'transport.csv')
+        with open(path, 'w') as f:
+            f.write('value,target_models,consequence,alternative\n')
+            f.write(f'car,crftwo,{REQUIRED},{NOT_REQUIRED}\n')
+            f.write('bicycle,crfthree crffour,,\n')
+        rule = CrfDecisionTableRule.from_csv(attr='f1', path=path)
+        self.assertEqual(rule.target_models, ['crftwo', 'crfthree', 'crffour'])
+        self.assertEqual(
+            [(row.value, row.consequence) for row in rule._rows],
+            [('car', REQUIRED), ('bicycle', REQUIRED)])
+
+    def test_snapshot_rule_evaluator_matches_evaluate_rules(self):
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        path = os.path.join(tempfile.mkdtemp(), 'references.jsonl')
+        with open(path, 'w') as f:
+            for field_name, value in [('f1', 'car'), ('f2', None), ('f3', None)]:
+                f.write(json.dumps(dict(
+                    subject_identifier=subject_visit.subject_identifier,
+                    model='edc_metadata_rules.crfone',
+                    visit_code=subject_visit.visit_code,
+                    field_name=field_name,
+                    value=value)) + '\n')
+        evaluator = SnapshotRuleEvaluator(
+            visit_model='edc_metadata_rules.subjectvisit',
+            visits=[dict(
+                subject_identifier=subject_visit.subject_identifier,
+                visit_schedule_name=subject_visit.visit_schedule_name,
+                schedule_name=subject_visit.schedule_name,
+                visit_code=subject_visit.visit_code,
+                visit_code_sequence=subject_visit.visit_code_sequence,
+                report_datetime=subject_visit.report_datetime.isoformat())],
+            registered_subjects=[dict(
+                subject_identifier=subject_visit.subject_identifier, gender=MALE)],
+            references=read_snapshot(path))
+        with self.assertNumQueries(0):
+            (visit, results), = list(evaluator.evaluate())
+            entry_statuses = evaluator.get_entry_statuses(results)
+        self.assertEqual(list(results), [CrfRuleGroupOne, CrfRuleGroupTwo])
+        for rule_group, (rule_results, _) in results.items():
+            with self.subTest(rule_group=rule_group):
+                self.assertEqual(
+                    rule_results, rule_group.evaluate_rules(visit=subject_visit)[0])
+        self.assertEqual(
+            entry_statuses[('edc_metadata_rules.crftwo', None)], REQUIRED)
+        self.assertEqual(
+            entry_statuses[('edc_metadata_rules.crfthree', None)], NOT_REQUIRED)
+
+    def test_snapshot_rule_evaluator_with_mmap_snapshot(self):
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        subject_identifier = subject_visit.subject_identifier
+        path = MmapSnapshotWriter(
+            os.path.join(tempfile.mkdtemp(), 'references.snapshot')).write(
+                references=[dict(
+                    subject_identifier=subject_identifier,
+                    model='edc_metadata_rules.crfone',
+                    visit_code=subject_visit.visit_code,
+                    field_name=field_name,
+                    value=value)
+                    for field_name, value in [('f1', 'car'), ('f2', None), ('f3', None)]],
+                registered_subjects=[
+                    dict(subject_identifier=subject_identifier, gender=MALE),
+                    dict(subject_identifier='0', gender=MALE)])
+        with MmapSnapshot(path) as snapshot:
+            self.assertEqual(
+                snapshot.registered_subjects.get(subject_identifier),
+                [dict(subject_identifier=subject_identifier, gender=MALE)])
+            self.assertEqual(snapshot.references.get('0'), [])
+            evaluator = SnapshotRuleEvaluator(
+                visit_model='edc_metadata_rules.subjectvisit',
+                visits=[dict(
+                    subject_identifier=subject_identifier,
+                    visit_schedule_name=subject_visit.visit_schedule_name,
+                    schedule_name=subject_visit.schedule_name,
+                    visit_code=subject_visit.visit_code,
+                    report_datetime=subject_visit.report_datetime)],
+                registered_subjects=snapshot.registered_subjects,
+                references=snapshot.references)
+            with self.assertNumQueries(0):
+                (_, results), = list(evaluator.evaluate())
+        self.assertEqual(
+            results[CrfRuleGroupOne][0],
+            CrfRuleGroupOne.evaluate_rules(visit=subject_visit)[0])
+
+    def test_metadata_updates_applied_once_in_sorted_order(self):
+        metadata_updates = [
+            (CrfRuleGroupTwo, MetadataUpdate('edc_metadata_rules.crfsix', None, REQUIRED)),
+            (CrfRuleGroupOne, MetadataUpdate('edc_metadata_rules.crftwo', None, REQUIRED)),
+            (CrfRuleGroupTwo, MetadataUpdate('edc_metadata_rules.crfsix', None, None)),
+            (CrfRuleGroupOne, MetadataUpdate(
+                'edc_metadata_rules.crftwo', None, NOT_REQUIRED))]
+        self.assertEqual(
+            [(rule_group, metadata_update.target_model, metadata_update.entry_status)
+             for rule_group, metadata_update
+             in MetadataRuleEvaluator.get_ordered_metadata_updates(metadata_updates)],
+            [(CrfRuleGroupTwo, 'edc_metadata_rules.crfsix', REQUIRED),
+             (CrfRuleGroupOne, 'edc_metadata_rules.crftwo', NOT_REQUIRED)])
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        metadata_objects = MetadataRuleEvaluator(visit=subject_visit).evaluate_rules(
+            deferred=False)
+        self.assertEqual(list(metadata_objects), sorted(metadata_objects))
+        self.assertEqual(
+            metadata_objects['edc_metadata_rules.crftwo'].entry_status, REQUIRED)
+
+    def test_aevaluate_rules(self):
+        from asgiref.sync import async_to_sync
+
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        CrfMetadata.objects.filter(model='edc_metadata_rules.crftwo').update(
+            entry_status=NOT_REQUIRED)
+        metadata_objects = async_to_sync(
+            MetadataRuleEvaluator(visit=subject_visit).aevaluate_rules)(deferred=False)
+        self.assertEqual(
+            metadata_objects['edc_metadata_rules.crftwo'].entry_status, REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crftwo').entry_status, REQUIRED)
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, NOT_REQUIRED)
+
+    def test_aprefetch_loads_values_before_evaluation(self):
+        from asgiref.sync import async_to_sync
+
+        subject_visit = self.enroll(gender=MALE)
+        CrfOne.objects.create(subject_visit=subject_visit, f1='car')
+        evaluator = MetadataRuleEvaluator(visit=subject_visit)
+        context = EvaluationContext(snapshot=site_metadata_rules.snapshot)
+        async_to_sync(evaluator.aprefetch)(context=context)
+        self.assertIn(subject_visit.subject_identifier, context.registered_subjects)
+        self.assertEqual(
+            sorted(dict(key[1:])['field_name'] for key in context.references),
+            ['f1', 'f3'])
+        with self.assertNumQueries(0):
+            with evaluation_context(context=context):
+                evaluator.get_metadata_updates()
+
+    def test_changed_fields_model_mixin(self):
+        """Asserts a source model with the changed fields mixin only
+        re-evaluates its rule group if a predicate field changed, and
+        on delete.
+        """
+        site_metadata_rules.register(rule_group_cls=CrfRuleGroupFour)
+        subject_visit = self.enroll(gender=MALE)
+        crf_four = CrfFour.objects.create(subject_visit=subject_visit, f1='bicycle')
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, NOT_REQUIRED)
+        CrfMetadata.objects.filter(model='edc_metadata_rules.crfthree').update(
+            entry_status=REQUIRED)
+
+        crf_four = CrfFour.objects.get(pk=crf_four.pk)
+        crf_four.f2 = 'unrelated'
+        crf_four.save()
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, REQUIRED)
+
+        crf_four.f1 = 'truck'
+        crf_four.save()
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, NOT_REQUIRED)
+
+        crf_four.delete()
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, REQUIRED)
+
+
+class TestDeferredEvaluationRollback(MetadataRulesTestMixin, TransactionTestCase):
+
+    def test_deferred_evaluation_discarded_on_rollback(self):
+        subject_visit = self.enroll(gender=MALE)
+        try:
+            with transaction.atomic(), deferred_rule_evaluation():
+                CrfOne.objects.create(subject_visit=subject_visit, f3='bicycle')
+                self.assertEqual(len(deferred_evaluations.pending), 1)
+                raise DatabaseError()
+        except DatabaseError:
+            pass
+        self.assertEqual(deferred_evaluations.pending, {})
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, REQUIRED)
+
+    def test_deferred_evaluation_discarded_on_savepoint_rollback(self):
+        subject_visit = self.enroll(gender=MALE)
+        with transaction.atomic(), deferred_rule_evaluation():
+            try:
+                with transaction.atomic():
+                    CrfOne.objects.create(subject_visit=subject_visit, f3='bicycle')
+                    raise DatabaseError()
+            except DatabaseError:
+                pass
+        self.assertEqual(deferred_evaluations.pending, {})
+        self.assertEqual(CrfMetadata.objects.get(
+            model='edc_metadata_rules.crfthree').entry_status, REQUIRED)
@@ -0,0 +1,54 @@
+from django.test import TestCase, TransactionTestCase
+
+from ..site import SiteMetadataRulesNotRegistered, site_metadata_rules
+from .load_test import DEADLOCK, LoadTest, LoadTestCrfOneRuleGroup, Sample
+from .load_test import get_error, percentile
+
+
+class TestLoadTest(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize(self):
+        samples = [Sample(0.001, 0.0, 0.002, 0.004, None),
+                   Sample(0.003, 0.001, 0.004, 0.008, None),
+                   Sample(None, None, None, 0.5,
+                          get_error(Exception('deadlock detected')))]
+        summary = LoadTest.summarize(samples)
+        self.assertEqual(samples[2].error, DEADLOCK)
+        self.assertEqual(summary['saves'], 3)
+        self.assertEqual(summary['deadlocks'], 1)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['evaluation_p50'], 1.0)
+        self.assertEqual(summary['lock_wait_p99'], 1.0)
+        self.assertEqual(summary['total_p99'], 8.0)
+
+
+class TestLoadTestRun(TransactionTestCase):
+
+    def test_concurrent_load(self):
+        load_test = LoadTest(subjects=2, saves=4)
+        load_test.setup()
+        self.addCleanup(load_test.teardown)
+        summary = load_test.run(workers=2)
+        self.assertEqual(summary['saves'], 8)
+        self.assertEqual(summary['deadlocks'], 0)
+        self.assertEqual(summary['errors'], 0)
+        self.assertIsNotNone(summary['total_p50'])
+
+    def test_teardown_unregisters_rule_groups(self):
+        load_test = LoadTest(subjects=1)
+        load_test.setup()
+        self.assertIs(
+            site_metadata_rules.get_rule_group(LoadTestCrfOneRuleGroup.name),
+            LoadTestCrfOneRuleGroup)
+        load_test.teardown()
+        self.assertRaises(
+            SiteMetadataRulesNotRegistered,
+            site_metadata_rules.get_rule_group, LoadTestCrfOneRuleGroup.name)
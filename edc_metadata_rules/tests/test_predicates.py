@@ -1,3 +1,6 @@
+import gc
+import re
+
 from django.test import TestCase, tag
 from edc_appointment.models import Appointment
 from edc_base import get_utcnow
@@ -8,7 +11,16 @@ from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 from edc_visit_tracking.constants import SCHEDULED
 from faker import Faker
 
-from ..predicate import PF, P, NoValueError
+from edc_metadata import DO_NOTHING, NOT_REQUIRED, REQUIRED
+
+from ..attribute_sources import attribute_sources, VISIT, REGISTERED_SUBJECT, REFERENCE
+from ..crf import CrfRule, CrfRuleGroup
+from ..evaluation_context import evaluation_context
+from ..predicate import PF, P, NoValueError, PredicateError, PredicateNotTranslatable
+from ..predicate import AndPredicate, NotPredicate, OrPredicate, intern_predicate
+from ..predicate import _interned
+from ..predicate_collection import PredicateCollection
+from ..rule_expression import RuleExpression, annotate_rule_outcomes
 from .models import SubjectVisit, SubjectConsent, CrfOne
 from .reference_configs import register_to_site_reference_configs
 from .visit_schedule import visit_schedule
@@ -18,6 +30,71 @@ from edc_facility.import_holidays import import_holidays
 fake = Faker()
 
 
+def crf_rule(predicate=None, alternative=None):
+    return CrfRule(
+        predicate=predicate,
+        consequence=REQUIRED,
+        alternative=alternative or NOT_REQUIRED,
+        target_models=['crftwo'])
+
+
+class RuleExpressionRuleGroup(CrfRuleGroup):
+
+    f1_eq = crf_rule(P('f1', 'eq', 'car'))
+    f1_neq = crf_rule(P('f1', 'neq', 'car'))
+    f2_is = crf_rule(P('f2', 'is', None))
+    f2_is_not = crf_rule(P('f2', 'is not', None))
+    f1_in = crf_rule(P('f1', 'in', ['car', 'bus']))
+    f1_not_in = crf_rule(P('f1', 'not in', ['car', 'bus']))
+    f3_gt = crf_rule(P('f3', 'gt', 'b'))
+    f3_lte = crf_rule(P('f3', 'lte', 'c'))
+    f3_between = crf_rule(P('f3', 'between', ('b', 'c')))
+    f1_regex = crf_rule(P('f1', 'regex', r'^tr'))
+    f1_and_f2 = crf_rule(P('f1', 'eq', 'car') & P('f2', 'eq', 'bicycle'))
+    f1_or_not_f2 = crf_rule(P('f1', 'eq', 'car') | ~P('f2', 'is', None))
+    f1_do_nothing = crf_rule(P('f1', 'eq', 'car'), alternative=DO_NOTHING)
+
+    class Meta:
+        app_label = 'edc_metadata_rules'
+        source_model = 'edc_metadata_rules.crfone'
+
+
+class Refset:
+
+    def __init__(self, **options):
+        self.options = options
+
+
+class Predicates(PredicateCollection):
+
+    app_label = 'edc_metadata_rules'
+    visit_model = 'edc_metadata_rules.subjectvisit'
+    refset_cls = Refset
+
+
+def matches(predicate=None, obj=None):
+    """Returns the outcome of a predicate of P for a model instance.
+    """
+    if isinstance(predicate, AndPredicate):
+        return all([matches(p, obj) for p in predicate.predicates])
+    elif isinstance(predicate, OrPredicate):
+        return any([matches(p, obj) for p in predicate.predicates])
+    elif isinstance(predicate, NotPredicate):
+        return not matches(predicate.predicate, obj)
+    return predicate.func(getattr(obj, predicate.attr), predicate.expected_value)
+
+
+class SubjectWithoutVisit:
+
+    """Declares `gender` on the class, like a reverse relation, but
+    raises for an instance without a related object.
+    """
+
+    @property
+    def gender(self):
+        raise Appointment.subjectvisit.RelatedObjectDoesNotExist()
+
+
 class TestPredicates(TestCase):
 
     def setUp(self):
@@ -80,6 +157,16 @@ class TestPredicates(TestCase):
             reference_getter_cls=ReferenceGetter)
         self.assertTrue(P('reason', 'eq', SCHEDULED)(**opts))
 
+    def test_p_falls_back_if_attr_raises_on_instance(self):
+        visit = self.enroll(gender=FEMALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            subject=SubjectWithoutVisit(),
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        self.assertTrue(P('gender', 'eq', FEMALE)(**opts))
+
     def test_p_with_field_on_source_not_keyed(self):
         """Assert raises NoValueError if CrfOne has not been keyed.
         """
@@ -145,3 +232,214 @@ class TestPredicates(TestCase):
             reference_getter_cls=ReferenceGetter)
         CrfOne.objects.create(subject_visit=visit, f1='car', f2='bicycle')
         self.assertTrue(PF('f1', 'f2', func=func)(**opts))
+
+    def test_p_and_short_circuits_before_reference_lookup(self):
+        """Asserts the cheap registered subject predicate is evaluated
+        first so the missing CrfOne value is never looked up.
+        """
+        visit = self.enroll(gender=FEMALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        predicate = P('f1', 'eq', 'car') & P('gender', 'eq', MALE)
+        self.assertFalse(predicate(**opts))
+        self.assertRaises(NoValueError, P('f1', 'eq', 'car'), **opts)
+
+    def test_p_or_short_circuits_before_reference_lookup(self):
+        visit = self.enroll(gender=FEMALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        predicate = P('f1', 'eq', 'car') | P('gender', 'eq', FEMALE)
+        self.assertTrue(predicate(**opts))
+
+    def test_p_and_or_not(self):
+        visit = self.enroll(gender=FEMALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        CrfOne.objects.create(subject_visit=visit, f1='car', f2='bicycle')
+        predicate = (
+            (P('f1', 'eq', 'car') | P('f1', 'eq', 'truck'))
+            & ~P('gender', 'eq', MALE)
+            & PF('f2', func=lambda x: x == 'bicycle'))
+        self.assertTrue(predicate(**opts))
+        self.assertFalse((~predicate)(**opts))
+        self.assertEqual(predicate.attrs, ('f1', 'gender', 'f2'))
+
+    def test_p_and_flattens(self):
+        predicate = P('f1', 'eq', 'car') & P('f2', 'eq', 'car') & P('f3', 'eq', 'car')
+        self.assertEqual(len(predicate.predicates), 3)
+        self.assertTrue(repr(predicate))
+
+    def test_p_to_q_matches_python(self):
+        visit = self.enroll(gender=FEMALE)
+        CrfOne.objects.create(subject_visit=visit, f1='car', f2='bicycle')
+        CrfOne.objects.create(subject_visit=self.enroll(gender=MALE), f1='truck')
+        for predicate in [P('f1', 'eq', 'car'),
+                          P('f1', 'neq', 'car'),
+                          P('f2', 'is', None),
+                          P('f2', 'is not', None),
+                          P('f1', 'in', ['car', 'bus']),
+                          P('f1', 'not in', ['car', 'bus']),
+                          P('f1', 'between', ('c', 'd')),
+                          P('f1', 'regex', r'^tr'),
+                          P('f1', 'eq', 'car') & P('f2', 'eq', 'bicycle'),
+                          P('f1', 'eq', 'car') | ~P('f2', 'is', None),
+                          ~(P('f1', 'eq', 'truck') | P('f2', 'eq', 'bicycle'))]:
+            with self.subTest(predicate=predicate):
+                expected = [
+                    obj.pk for obj in CrfOne.objects.all() if matches(predicate, obj)]
+                pks = list(CrfOne.objects.filter(
+                    predicate.to_q()).values_list('pk', flat=True))
+                self.assertEqual(sorted(pks), sorted(expected))
+
+    def test_annotate_rule_outcomes_matches_rule_run(self):
+        """Asserts the annotated outcome of each rule equals the
+        result of `Rule.run`, including for fields without a value.
+
+        Ordering operators are only compared on f3 since the value is
+        never None.
+        """
+        for f1, f2, f3 in [('car', 'bicycle', 'b'),
+                           ('truck', None, 'c'),
+                           (None, None, 'd')]:
+            CrfOne.objects.create(
+                subject_visit=self.enroll(gender=MALE), f1=f1, f2=f2, f3=f3)
+        queryset, untranslatable_rules = annotate_rule_outcomes(
+            queryset=CrfOne.objects.all(), rule_group=RuleExpressionRuleGroup)
+        self.assertEqual(untranslatable_rules, [])
+        self.assertEqual(queryset.count(), 3)
+        for obj in queryset:
+            for rule in RuleExpressionRuleGroup.get_rules():
+                with self.subTest(rule=rule.name, f1=obj.f1, f2=obj.f2, f3=obj.f3):
+                    self.assertEqual(
+                        getattr(obj, rule.name),
+                        list(rule.run(visit=obj.subject_visit).values())[0])
+
+    def test_annotate_rule_outcomes_no_row_without_source(self):
+        """Asserts a visit without a source model instance has no
+        outcome, as with `Rule.run`.
+        """
+        visit = self.enroll(gender=MALE)
+        queryset, _ = annotate_rule_outcomes(
+            queryset=CrfOne.objects.filter(subject_visit=visit),
+            rule_group=RuleExpressionRuleGroup)
+        self.assertFalse(queryset.exists())
+        for rule in RuleExpressionRuleGroup.get_rules():
+            with self.subTest(rule=rule.name):
+                self.assertEqual(list(rule.run(visit=visit).values()), [None])
+
+    def test_rule_expression_untranslatable(self):
+        rule = crf_rule(PF('f1', func=lambda x: x == 'car'))
+        expression = RuleExpression(rule=rule)
+        self.assertFalse(expression.translatable)
+        self.assertRaises(PredicateNotTranslatable, expression.as_case)
+
+    def test_p_to_q_field_map(self):
+        q = P('gender', 'eq', MALE).to_q(field_map={'gender': 'subject_visit__gender'})
+        self.assertEqual(q.children, [('subject_visit__gender__exact', MALE)])
+
+    def test_pf_to_q_raises(self):
+        self.assertRaises(
+            PredicateNotTranslatable,
+            PF('f1', func=lambda x: x == 'car').to_q)
+        self.assertRaises(
+            PredicateNotTranslatable,
+            (P('f1', 'eq', 'car') & PF('f1', func=lambda x: x == 'car')).to_q)
+
+    def test_attribute_sources(self):
+        for attr, source in [('reason', VISIT),
+                             ('gender', REGISTERED_SUBJECT),
+                             ('f1', REFERENCE)]:
+            with self.subTest(attr=attr):
+                self.assertEqual(attribute_sources.get_source(
+                    attr=attr,
+                    visit_model_cls=SubjectVisit,
+                    registered_subject_model_cls=RegisteredSubject), source)
+
+    def test_predicates_compare_by_structure(self):
+        self.assertEqual(P('gender', 'eq', MALE), P('gender', 'eq', MALE))
+        self.assertEqual(hash(P('gender', 'eq', MALE)), hash(P('gender', 'eq', MALE)))
+        self.assertNotEqual(P('gender', 'eq', MALE), P('gender', 'eq', FEMALE))
+        self.assertNotEqual(P('f1', 'is', 1), P('f1', 'is', True))
+        self.assertEqual(
+            P('f1', 'eq', 'car') & ~P('f2', 'eq', 'car'),
+            P('f1', 'eq', 'car') & ~P('f2', 'eq', 'car'))
+        self.assertIs(
+            intern_predicate(P('gender', 'eq', MALE)),
+            intern_predicate(P('gender', 'eq', MALE)))
+
+    def test_predicate_evaluated_once_per_context(self):
+        visit = self.enroll(gender=MALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        values = []
+
+        def func(value):
+            values.append(value)
+            return value == MALE
+
+        with evaluation_context():
+            self.assertTrue(PF('gender', func=func)(**opts))
+            self.assertTrue(PF('gender', func=func)(**opts))
+        self.assertEqual(values, [MALE])
+
+    def test_refset_shared_by_visits_of_subject(self):
+        pc = Predicates()
+        opts = dict(reference_name='edc_metadata_rules.crfone', subject_identifier='1')
+        with evaluation_context():
+            refset = pc.refsets(report_datetime=get_utcnow(), **opts)
+            self.assertIs(pc.refsets(report_datetime=get_utcnow(), **opts), refset)
+            self.assertIsNot(
+                pc.refsets(reference_name='edc_metadata_rules.crfone',
+                           subject_identifier='2', report_datetime=get_utcnow()),
+                refset)
+
+    def test_p_set_range_and_regex_operators(self):
+        visit = self.enroll(gender=MALE)
+        opts = dict(
+            source_model='edc_metadata_rules.crfone',
+            registered_subject=self.registered_subject,
+            visit=visit,
+            reference_getter_cls=ReferenceGetter)
+        predicate = P('gender', 'in', [MALE, FEMALE])
+        self.assertEqual(predicate.expected_value, frozenset([MALE, FEMALE]))
+        self.assertTrue(predicate(**opts))
+        self.assertFalse(P('gender', 'not in', [MALE])(**opts))
+        self.assertTrue(P('gender', 'regex', f'^{MALE[0]}')(**opts))
+        self.assertTrue(P('age', 'between', (18, 64)).func(18, (18, 64)))
+        self.assertFalse(P('age', 'between', (18, 64)).func(65, (18, 64)))
+        self.assertRaises(PredicateError, P, 'gender', 'in', MALE)
+        self.assertRaises(PredicateError, P, 'age', 'between', 18)
+        self.assertRaises(PredicateError, P, 'f1', 'between', 'ad')
+        self.assertRaises(PredicateError, P, 'age', 'between', (18, 'a'))
+        self.assertRaises(PredicateError, P, 'age', 'between', [18, 40, 64])
+        self.assertRaises(PredicateError, P, 'f1', 'regex', '[')
+
+    def test_p_regex_flags_to_q(self):
+        CrfOne.objects.create(subject_visit=self.enroll(gender=MALE), f1='Truck')
+        predicate = P('f1', 'regex', re.compile(r'^tr', re.IGNORECASE))
+        self.assertEqual(predicate.to_q().children, [('f1__iregex', '^tr')])
+        self.assertEqual(CrfOne.objects.filter(predicate.to_q()).count(), 1)
+        self.assertTrue(predicate.func('Truck', predicate.expected_value))
+        self.assertRaises(
+            PredicateNotTranslatable,
+            P('f1', 'regex', re.compile(r'^tr$', re.MULTILINE)).to_q)
+
+    def test_interned_predicates_are_released(self):
+        predicate = intern_predicate(P('f1', 'eq', 'released'))
+        structure = predicate.structure
+        self.assertIn(structure, _interned)
+        del predicate
+        gc.collect()
+        self.assertNotIn(structure, _interned)
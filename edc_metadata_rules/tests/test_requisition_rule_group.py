@@ -10,9 +10,11 @@ from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 from edc_visit_tracking.constants import SCHEDULED
 from faker import Faker
 
+from ..metadata_rule_evaluator import MetadataRuleEvaluator
 from ..predicate import P
 from ..requisition import RequisitionRuleGroupMetaOptionsError
 from ..requisition import RequisitionRuleGroup, RequisitionRule
+from ..rule_group import MetadataUpdate
 from ..site import site_metadata_rules
 from .reference_configs import register_to_site_reference_configs
 from .models import Appointment, SubjectVisit, SubjectConsent, SubjectRequisition
@@ -39,6 +41,15 @@ panel_seven = RequisitionPanel('seven')
 panel_eight = RequisitionPanel('eight')
 
 
+class UpdatesRuleGroup:
+    """Returns metadata updates as metadata objects.
+    """
+
+    @classmethod
+    def update_metadata(cls, visit=None, metadata_updates=None):
+        return OrderedDict([(u.target_panel or u.target_model, u) for u in metadata_updates])
+
+
 class BadPanelsRequisitionRuleGroup(RequisitionRuleGroup):
     """Specifies invalid panel names.
     """
@@ -250,6 +261,42 @@ class TestRequisitionRuleGroup(TestCase):
                         'RequisitionRuleGroup2.female'][key]:
                     self.assertEqual(rule_result.entry_status, NOT_REQUIRED)
 
+    def test_rules_by_source_panel(self):
+        self.assertEqual(
+            [rule.name for rule in RequisitionRuleGroup2.get_rules(source_panel='five')],
+            ['male'])
+        self.assertEqual(
+            [rule.name for rule in RequisitionRuleGroup2.get_rules(
+                source_panel=self.panel_six)],
+            ['female'])
+        self.assertEqual(RequisitionRuleGroup2.get_rules(source_panel='seven'), ())
+        self.assertEqual(
+            [rule.name for rule in MyRequisitionRuleGroup.get_rules(source_panel='five')],
+            ['male', 'female'])
+        self.assertEqual(
+            RequisitionRuleGroup2.male.target_panel_names, frozenset(['one', 'two']))
+
+    def test_rule_results_for_source_panel(self):
+        subject_visit = self.enroll(gender=MALE)
+        rule_results, _ = RequisitionRuleGroup2().evaluate_rules(
+            visit=subject_visit, source_panel='five')
+        self.assertEqual(list(rule_results), ['RequisitionRuleGroup2.male'])
+
+    def test_source_panel_only_for_rule_groups_of_source_model(self):
+        metadata_rule_evaluator = MetadataRuleEvaluator(
+            app_label='edc_metadata_rules',
+            source_model=RequisitionRuleGroup2._meta.source_model,
+            source_panel=panel_five)
+        self.assertEqual(
+            metadata_rule_evaluator.get_rule_group_options(RequisitionRuleGroup2),
+            dict(source_panel='five'))
+        metadata_rule_evaluator = MetadataRuleEvaluator(
+            app_label='edc_metadata_rules',
+            source_model='edc_metadata_rules.crfone',
+            source_panel=panel_five)
+        self.assertEqual(
+            metadata_rule_evaluator.get_rule_group_options(RequisitionRuleGroup2), {})
+
     def test_metadata_for_rule_male_with_source_model_as_requisition1(self):
         subject_visit = self.enroll(gender=MALE)
         site_metadata_rules.registry = OrderedDict()
@@ -292,9 +339,9 @@ class TestRequisitionRuleGroup(TestCase):
             identifier=subject_visit.subject_identifier,
             report_datetime=subject_visit.report_datetime,
             field_name='panel',
-            value_uuid=self.panel_five.id)
+            value_uuid=self.panel_six.id)
         SubjectRequisition.objects.create(
-            subject_visit=subject_visit, panel=self.panel_five)
+            subject_visit=subject_visit, panel=self.panel_six)
         for panel in [self.panel_three, self.panel_four]:
             with self.subTest(panel=panel):
                 obj = RequisitionMetadata.objects.get(
@@ -304,6 +351,26 @@ class TestRequisitionRuleGroup(TestCase):
                     panel_name=panel.name)
                 self.assertEqual(obj.entry_status, REQUIRED)
 
+    def test_requisition_save_runs_rules_for_saved_panel(self):
+        """Asserts saving a requisition only runs the rules declared
+        for its panel.
+        """
+        subject_visit = self.enroll(gender=FEMALE)
+        site_metadata_rules.registry = OrderedDict()
+        site_metadata_rules.register(RequisitionRuleGroup2)
+        SubjectRequisition.objects.create(
+            subject_visit=subject_visit, panel=self.panel_five)
+        self.assertEqual(RequisitionMetadata.objects.get(
+            subject_identifier=subject_visit.subject_identifier,
+            visit_code=subject_visit.visit_code,
+            panel_name='four').entry_status, NOT_REQUIRED)
+        SubjectRequisition.objects.create(
+            subject_visit=subject_visit, panel=self.panel_six)
+        self.assertEqual(RequisitionMetadata.objects.get(
+            subject_identifier=subject_visit.subject_identifier,
+            visit_code=subject_visit.visit_code,
+            panel_name='four').entry_status, REQUIRED)
+
     def test_metadata_for_rule_female_with_source_model_as_requisition2(self):
         subject_visit = self.enroll(gender=FEMALE)
         site_metadata_rules.registry = OrderedDict()
@@ -502,3 +569,24 @@ class TestRequisitionRuleGroup(TestCase):
             visit_code=subject_visit.visit_code,
             panel_name=self.panel_six.name)
         self.assertEqual(metadata_obj.entry_status, KEYED)
+
+    def test_metadata_objects_keyed_by_model_and_panel(self):
+        """Asserts requisitions of different models with the same
+        panel name are not deduplicated.
+        """
+        metadata_updates = [
+            MetadataUpdate('app.requisitionone', panel_one, REQUIRED),
+            MetadataUpdate('app.requisitiontwo', panel_one, NOT_REQUIRED),
+            MetadataUpdate('app.crfone', None, REQUIRED),
+            MetadataUpdate('app.requisitionone', panel_one, NOT_REQUIRED)]
+        metadata_objects = MetadataRuleEvaluator(
+            app_label='edc_metadata_rules').apply_rule_metadata_updates(
+                [(UpdatesRuleGroup, metadata_update)
+                 for metadata_update in metadata_updates])
+        self.assertEqual(
+            list(metadata_objects),
+            ['app.crfone', ('app.requisitionone', 'one'), ('app.requisitiontwo', 'one')])
+        self.assertEqual(
+            metadata_objects[('app.requisitionone', 'one')].entry_status, NOT_REQUIRED)
+        self.assertEqual(
+            metadata_objects[('app.requisitiontwo', 'one')].entry_status, NOT_REQUIRED)
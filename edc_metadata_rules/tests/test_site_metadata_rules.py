@@ -1,3 +1,7 @@
+import os
+import sys
+import tempfile
+
 from collections import OrderedDict
 from django.test import TestCase, tag
 
@@ -7,7 +11,9 @@ from edc_metadata import REQUIRED, NOT_REQUIRED
 from ..crf import CrfRule, CrfRuleGroup
 from ..decorators import register, RegisterRuleGroupError
 from ..predicate import P
-from ..site import SiteMetadataRulesAlreadyRegistered
+from ..registry_snapshot import RegistrySnapshotError
+from ..rule import RuleError
+from ..site import SiteMetadataRulesAlreadyRegistered, SiteMetadataRulesNotRegistered
 from ..site import site_metadata_rules, SiteMetadataNoRulesError
 from .reference_configs import register_to_site_reference_configs
 
@@ -109,3 +115,90 @@ class TestSiteMetadataRules(TestCase):
             pass
         else:
             self.fail('RegisterRuleGroupError unexpectedly not raised.')
+
+    def test_register_publishes_new_snapshot(self):
+        snapshot = site_metadata_rules.snapshot
+        site_metadata_rules.register(RuleGroupWithRules)
+        self.assertEqual(snapshot.rule_groups('edc_metadata_rules'), ())
+        self.assertEqual(
+            site_metadata_rules.snapshot.rule_groups('edc_metadata_rules'),
+            (RuleGroupWithRules, ))
+        self.assertGreater(site_metadata_rules.snapshot.version, snapshot.version)
+
+    def test_loading_publishes_one_snapshot(self):
+        snapshot = site_metadata_rules.snapshot
+        with site_metadata_rules.loading():
+            site_metadata_rules.register(RuleGroupWithRules)
+            site_metadata_rules.register(RuleGroupWithRules2)
+            self.assertIs(site_metadata_rules.snapshot, snapshot)
+        self.assertEqual(site_metadata_rules.snapshot.version, snapshot.version + 1)
+        self.assertEqual(
+            site_metadata_rules.snapshot.rule_groups('edc_metadata_rules'),
+            (RuleGroupWithRules, RuleGroupWithRules2))
+        site_metadata_rules.unregister(RuleGroupWithRules2.name)
+        self.assertEqual(site_metadata_rules.snapshot.version, snapshot.version + 2)
+
+    def test_snapshot_is_read_only(self):
+        site_metadata_rules.register(RuleGroupWithRules)
+        snapshot = site_metadata_rules.snapshot
+        self.assertRaises(
+            RegistrySnapshotError, setattr, snapshot, 'registry', {})
+        self.assertRaises(
+            TypeError, snapshot.registry.update, {'blah': ()})
+
+    def test_rule_is_frozen(self):
+        rule = RuleGroupWithRules.rule1
+        self.assertRaises(RuleError, setattr, rule, 'name', 'blah')
+        self.assertEqual(rule.name, 'rule1')
+
+    def test_register_replace_and_unregister(self):
+        site_metadata_rules.register(RuleGroupWithRules)
+        site_metadata_rules.register(RuleGroupWithRules2)
+        self.assertRaises(
+            SiteMetadataRulesAlreadyRegistered,
+            site_metadata_rules.register, RuleGroupWithRules)
+        site_metadata_rules.register(RuleGroupWithRules, replace=True)
+        self.assertEqual(
+            site_metadata_rules.snapshot.rule_groups('edc_metadata_rules'),
+            (RuleGroupWithRules, RuleGroupWithRules2))
+        site_metadata_rules.unregister(RuleGroupWithRules.name)
+        self.assertEqual(
+            site_metadata_rules.snapshot.rule_groups('edc_metadata_rules'),
+            (RuleGroupWithRules2, ))
+        self.assertRaises(
+            SiteMetadataRulesNotRegistered,
+            site_metadata_rules.unregister, RuleGroupWithRules.name)
+
+    def test_reload_rules_module(self):
+        source = (
+            'from edc_constants.constants import MALE\n'
+            'from edc_metadata import REQUIRED, NOT_REQUIRED\n'
+            'from edc_metadata_rules import CrfRule, CrfRuleGroup, P, register\n\n\n'
+            '@register()\n'
+            'class ReloadRuleGroup(CrfRuleGroup):\n'
+            '    rule1 = CrfRule(\n'
+            '        predicate=P(\'gender\', \'eq\', MALE),\n'
+            '        consequence={consequence},\n'
+            '        alternative={alternative},\n'
+            '        target_models=[\'crfone\'])\n\n'
+            '    class Meta:\n'
+            '        app_label = \'edc_metadata_rules\'\n')
+        path = tempfile.mkdtemp()
+        sys.path.insert(0, path)
+        try:
+            with open(os.path.join(path, 'reload_metadata_rules.py'), 'w') as f:
+                f.write(source.format(consequence='REQUIRED', alternative='NOT_REQUIRED'))
+            import reload_metadata_rules
+            rule_group = reload_metadata_rules.ReloadRuleGroup
+            snapshot = site_metadata_rules.snapshot
+            with open(os.path.join(path, 'reload_metadata_rules.py'), 'w') as f:
+                f.write(source.format(consequence='NOT_REQUIRED', alternative='NOT_REQUIRED'))
+            new_snapshot = site_metadata_rules.reload('reload_metadata_rules')
+            self.assertEqual(new_snapshot.version, snapshot.version + 1)
+            self.assertEqual(snapshot.rule_groups('edc_metadata_rules'), (rule_group, ))
+            new_rule_group, = new_snapshot.rule_groups('edc_metadata_rules')
+            self.assertIsNot(new_rule_group, rule_group)
+            self.assertEqual(new_rule_group.rule1._logic.consequence, NOT_REQUIRED)
+        finally:
+            sys.path.remove(path)
+            sys.modules.pop('reload_metadata_rules', None)
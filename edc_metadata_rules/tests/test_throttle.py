@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from ..throttle import Throttle, ThrottleError
+
+
+class TestThrottle(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.slept = []
+
+    def get_throttle(self, **kwargs):
+        return Throttle(clock=lambda: self.now, sleep=self.slept.append, **kwargs)
+
+    def test_max_rate(self):
+        throttle = self.get_throttle(max_rate=10)
+        for chunk in throttle.chunks(range(25), chunk_size=10):
+            self.now += 0.25
+        self.assertEqual(self.slept, [0.75, 0.75, 0.25])
+        self.assertEqual(throttle.items, 25)
+        self.assertEqual(throttle.chunk_count, 3)
+        self.assertRaises(ThrottleError, Throttle, max_rate=0)
+
+    def test_adaptive_backs_off_and_recovers(self):
+        throttle = self.get_throttle(
+            adaptive=True, latency_threshold=0.5, backoff_factor=2.0, max_delay=0.3)
+        for latency in [1.0, 1.0, 1.0, 1.0, 0.1, 0.1, 0.1, 0.1]:
+            throttle.throttle(items=1, elapsed=latency)
+        self.assertEqual(self.slept, [0.05, 0.1, 0.2, 0.3, 0.15, 0.075])
+        self.assertEqual(throttle.delay, 0.0)
+        self.assertEqual(throttle.slow_chunks, 4)
+
+    def test_adaptive_compares_latency_per_item(self):
+        throttle = self.get_throttle(
+            adaptive=True, latency_threshold=0.5, backoff_factor=2.0)
+        for elapsed in [2.0, 8.0, 8.0, 2.0, 2.0, 2.0]:
+            for chunk in throttle.chunks(range(10), chunk_size=10):
+                self.now += elapsed
+        self.assertEqual(self.slept, [0.05, 0.1, 0.05])
+        self.assertEqual(throttle.slow_chunks, 2)
+        self.assertEqual(throttle.delay, 0.0)
@@ -0,0 +1,126 @@
+import time
+
+
+class ThrottleError(Exception):
+    pass
+
+
+class Throttle:
+
+    """A class to pace a backfill so it does not compete with data
+    entry.
+
+    Items are processed in chunks, see `chunks`. After each chunk,
+    the throttle sleeps long enough to keep under `max_rate` items per
+    second. If adaptive, it also backs off while items take longer
+    than `latency_threshold` seconds each, on average over the chunk,
+    so the threshold does not depend on the chunk size: the delay is
+    multiplied by `backoff_factor` after each slow chunk, up to
+    `max_delay`, and divided by it after each fast chunk.
+
+    For example:
+
+        throttle = Throttle(max_rate=50, adaptive=True, latency_threshold=0.05)
+        for chunk in throttle.chunks(subject_identifiers, chunk_size=10):
+            with transaction.atomic():
+                ...
+    """
+
+    min_delay = 0.05
+
+    def __init__(self, max_rate=None, adaptive=None, latency_threshold=None,
+                 backoff_factor=None, max_delay=None, clock=None, sleep=None):
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        self.latency_threshold = latency_threshold or 1.0
+        self.backoff_factor = backoff_factor or 2.0
+        self.max_delay = max_delay or 30.0
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        if self.max_rate is not None and self.max_rate <= 0:
+            raise ThrottleError(f'Expected max_rate > 0. Got {self.max_rate}.')
+        if self.backoff_factor <= 1:
+            raise ThrottleError(
+                f'Expected backoff_factor > 1. Got {self.backoff_factor}.')
+        self.delay = 0.0
+        self.items = 0
+        self.chunk_count = 0
+        self.slow_chunks = 0
+        self.slept = 0.0
+
+    @classmethod
+    def from_options(cls, options=None):
+        """Returns a throttle for the options of a management command,
+        see `add_throttle_arguments`.
+        """
+        return cls(
+            max_rate=options.get('max_rate'),
+            adaptive=options.get('adaptive'),
+            latency_threshold=options.get('latency_threshold'))
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(max_rate={self.max_rate}, '
+                f'adaptive={self.adaptive}, '
+                f'latency_threshold={self.latency_threshold})')
+
+    def __str__(self):
+        return (f'{self.items} item(s) in {self.chunk_count} chunk(s), '
+                f'{self.slow_chunks} slow, {self.slept:.1f}s throttled')
+
+    def chunks(self, iterable=None, chunk_size=None):
+        """Yields lists of up to `chunk_size` items and throttles
+        after the caller has processed each one.
+        """
+        chunk_size = chunk_size or 1
+        chunk = []
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield from self._throttled(chunk)
+                chunk = []
+        if chunk:
+            yield from self._throttled(chunk)
+
+    def _throttled(self, chunk=None):
+        start = self.clock()
+        yield chunk
+        self.throttle(items=len(chunk), elapsed=self.clock() - start)
+
+    def throttle(self, items=None, elapsed=None):
+        """Sleeps, if needed, after a chunk of `items` took `elapsed`
+        seconds.
+        """
+        self.items += items
+        self.chunk_count += 1
+        if self.adaptive:
+            if elapsed / items > self.latency_threshold:
+                self.slow_chunks += 1
+                self.delay = min(
+                    self.max_delay, max(self.min_delay, self.delay * self.backoff_factor))
+            else:
+                self.delay = self.delay / self.backoff_factor
+                if self.delay < self.min_delay:
+                    self.delay = 0.0
+        delay = self.delay
+        if self.max_rate:
+            delay = max(delay, items / self.max_rate - elapsed)
+        if delay > 0:
+            self.sleep(delay)
+            self.slept += delay
+
+
+def add_throttle_arguments(parser=None):
+    """Adds the throttle options to a management command's parser.
+    """
+    parser.add_argument(
+        '--chunk-size', dest='chunk_size', type=int, default=10,
+        help='subjects per transaction. Default: 10')
+    parser.add_argument(
+        '--max-rate', dest='max_rate', type=float, default=None,
+        help='maximum subjects per second. Default: no limit')
+    parser.add_argument(
+        '--adaptive', dest='adaptive', action='store_true', default=False,
+        help='back off while subjects take longer than --latency-threshold')
+    parser.add_argument(
+        '--latency-threshold', dest='latency_threshold', type=float, default=1.0,
+        help='seconds per subject above which --adaptive backs off. Default: 1.0')
@@ -21,6 +21,7 @@ setup(
     description='Create rules to manipulate metadata (edc-metadata)',
     long_description=README,
     zip_safe=False,
+    install_requires=['asgiref>=3.2'],
     keywords='django Edc data entry metadata rules',
     classifiers=[
         'Environment :: Web Environment',